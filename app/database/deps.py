@@ -1,17 +1,171 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import asyncio
+import time
+from typing import Dict, Optional
+
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.settings import Settings
 
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_time = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_time += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_in": self.checkedin(),
+            "checked_out": self.checkedout(),
+            "connections": self.size() + self.overflow(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": self.checkouts,
+            "wait_time": self.wait_time,
+            "wait_max": self.wait_max,
+        }
+
+
 settings = Settings.get()
-engine = create_async_engine(settings.async_connection_url)
 Base = declarative_base()
+_engine: Optional[AsyncEngine] = None
+_sessionmaker: Optional[sessionmaker] = None
+_replica_engine: Optional[AsyncEngine] = None
+_replica_sessionmaker: Optional[sessionmaker] = None
 
 
-async def get_async_session() -> AsyncSession:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
+def _create_engine(url: str) -> AsyncEngine:
+    return create_async_engine(
+        url,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args={
+            # asyncpg's own statement cache and SQLAlchemy's prepared
+            # statement cache; both have to be 0 behind PgBouncer in
+            # transaction mode.
+            "statement_cache_size": settings.db_statement_cache_size,
+            "prepared_statement_cache_size": settings.db_statement_cache_size,
+        },
+    )
+
+
+def get_engine() -> AsyncEngine:
+    global _engine, _sessionmaker
+    if _engine is None:
+        _engine = _create_engine(settings.async_connection_url)
+        _sessionmaker = sessionmaker(
+            _engine, class_=AsyncSession, expire_on_commit=False
+        )
+    return _engine
+
+
+def get_replica_engine() -> AsyncEngine:
+    # Without a configured replica, reads share the primary engine.
+    global _replica_engine, _replica_sessionmaker
+    if settings.replica_async_connection_url is None:
+        return get_engine()
+    if _replica_engine is None:
+        _replica_engine = _create_engine(settings.replica_async_connection_url)
+        _replica_sessionmaker = sessionmaker(
+            _replica_engine, class_=AsyncSession, expire_on_commit=False
+        )
+    return _replica_engine
+
+
+def async_session() -> AsyncSession:
+    get_engine()
+    return _sessionmaker()
+
+
+def async_read_session() -> AsyncSession:
+    if settings.replica_async_connection_url is None:
+        return async_session()
+    get_replica_engine()
+    return _replica_sessionmaker()
+
+
+def engines() -> Dict[str, AsyncEngine]:
+    if settings.replica_async_connection_url is None:
+        return {"primary": get_engine()}
+    return {"primary": get_engine(), "replica": get_replica_engine()}
+
+
+def primary_session(session: AsyncSession) -> AsyncSession:
+    # A read session carries the request's primary session, for reads
+    # that must not see replica lag.
+    return session.info.get("primary", session)
+
+
+def new_session(session: AsyncSession) -> AsyncSession:
+    # A session of its own on the same engine, for work that must not end
+    # with the request that owns session.
+    return AsyncSession(session.bind, expire_on_commit=False)
+
+
+async def warm_up_engine(connections: int):
+    # The connections are held at the same time so each one is new; once
+    # closed they stay in the pool, idle.
+    opened = await asyncio.gather(
+        *(
+            engine.connect()
+            for engine in engines().values()
+            for _ in range(connections)
+        ),
+        return_exceptions=True,
     )
+    errors = [item for item in opened if isinstance(item, BaseException)]
+    for connection in opened:
+        if not isinstance(connection, BaseException):
+            await connection.close()
+    if errors:
+        raise errors[0]
+
+
+async def dispose_engine():
+    global _engine, _sessionmaker, _replica_engine, _replica_sessionmaker
+    for engine in (_engine, _replica_engine):
+        if engine is not None:
+            await engine.dispose()
+    _engine = _sessionmaker = None
+    _replica_engine = _replica_sessionmaker = None
+
+
+async def get_async_session() -> AsyncSession:
     async with async_session() as session:
         yield session
+
+
+async def get_async_read_session(
+    primary: AsyncSession = Depends(get_async_session),
+) -> AsyncSession:
+    if settings.replica_async_connection_url is None:
+        yield primary
+        return
+    # Sessions connect lazily, so the primary one costs nothing unless a
+    # read is actually routed to it.
+    async with async_read_session() as session:
+        session.info["primary"] = primary
+        yield session
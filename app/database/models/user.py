@@ -1,13 +1,35 @@
-from sqlalchemy import Column, Integer, LargeBinary, String
+from sqlalchemy import DDL, Column, Index, Integer, LargeBinary, String, event
 
 from app.database import deps as database_deps
 
 
 class User(database_deps.Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index(
+            "ix_users_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_users_phone_trgm",
+            "phone",
+            postgresql_using="gin",
+            postgresql_ops={"phone": "gin_trgm_ops"},
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     phone = Column(String, nullable=False, unique=True, index=True)
     password = Column(LargeBinary, nullable=False)
     refresh_token = Column(String)
+
+
+# The trigram indexes need the extension; migrations create it too.
+event.listen(
+    User.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+)
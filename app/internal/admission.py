@@ -0,0 +1,134 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque
+
+from fastapi import HTTPException, status
+
+from app.internal import metrics
+from app.settings import Settings
+
+settings = Settings.get()
+
+
+class AdmissionStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+        self.queued_total = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def observe_wait(self, wait_time: float):
+        self.queued_total += 1
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+
+
+class AdmissionController:
+    # At most `concurrency` requests run at once; up to `queue_size` more
+    # wait in FIFO order for at most `timeout` seconds. Everything beyond
+    # that is rejected right away, so overload turns into fast 503s
+    # instead of an ever-growing queue in front of the hashing executor.
+    def __init__(
+        self,
+        concurrency: int,
+        queue_size: int,
+        timeout: float,
+        retry_after: int,
+    ):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.stats = AdmissionStats()
+
+    @asynccontextmanager
+    async def slot(self):
+        with metrics.stage(metrics.ADMISSION):
+            await self._acquire()
+        try:
+            yield
+        finally:
+            self._release()
+
+    def as_dict(self) -> dict:
+        queued = self.stats.queued_total or 1
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "admitted": self.stats.admitted,
+            "rejected_queue_full": self.stats.rejected_queue_full,
+            "rejected_deadline": self.stats.rejected_deadline,
+            "wait_time_avg": self.stats.wait_time_total / queued,
+            "wait_time_max": self.stats.wait_time_max,
+        }
+
+    async def _acquire(self):
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            self.stats.admitted += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            self.stats.rejected_queue_full += 1
+            raise self._overloaded()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            self.stats.rejected_deadline += 1
+            raise self._overloaded()
+        except asyncio.CancelledError:
+            # The slot may have been handed over just before cancellation.
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self.stats.observe_wait(time.perf_counter() - started)
+        self.stats.admitted += 1
+
+    def _release(self):
+        # Hand the slot straight to the oldest live waiter, so in_flight
+        # only drops when nobody is queued.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _overloaded(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервер перегружен, повторите попытку позже",
+            headers={"Retry-After": str(self.retry_after)},
+        )
+
+
+controllers = {
+    # Login and register share one controller: both hash, and together
+    # they should not admit more than the hashing pool can run.
+    "auth": AdmissionController(
+        concurrency=settings.auth_admission_concurrency,
+        queue_size=settings.auth_admission_queue_size,
+        timeout=settings.auth_admission_timeout,
+        retry_after=settings.auth_admission_retry_after,
+    ),
+    # Bulk imports hash in the background for a long time: they are not
+    # queued, a second one is turned away while the first is running.
+    "import": AdmissionController(
+        concurrency=settings.users_import_concurrency,
+        queue_size=0,
+        timeout=settings.auth_admission_timeout,
+        retry_after=settings.auth_admission_retry_after,
+    ),
+}
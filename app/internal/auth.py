@@ -1,20 +1,29 @@
 import datetime
-
+import hashlib
+import logging
+import math
+import time
+import uuid
+from typing import Optional, Union
+
+import aioredis
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from pydantic import BaseSettings, Field
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database.deps import get_async_session
+from app.database.deps import get_async_read_session
 from app.database.models.user import User
+from app.internal import hashing, metrics
+from app.internal import user as user_internal
+from app.internal.cache import LocalCache
+from app.internal.tokens import RedisRefreshTokenStore
 from app.schemas.auth import AuthStatus, LoginScheme, PostUserScheme
 from app.schemas.user import GetUserScheme
+from app.settings import Settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 ACCESS_PURPOSE = "access"
 REFRESH_PURPOSE = "refresh"
@@ -24,20 +33,41 @@ CREDENTIAL_EXCEPTION = HTTPException(
     detail="Could not validate credentials",
     headers={"WWW-Authenticate": "Bearer"},
 )
+TOKEN_STORE_UNAVAILABLE_EXCEPTION = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Сервис временно недоступен, повторите попытку позже",
+    headers={"Retry-After": "5"},
+)
+ADMIN_REQUIRED_EXCEPTION = HTTPException(
+    status_code=status.HTTP_403_FORBIDDEN,
+    detail="Admin privileges required",
+)
 
-
-class Settings(BaseSettings):
-    jwt_secret_key: str = Field(..., env="JWT_SECRET_KEY")
-    access_token_expire_minutes: int = Field(
-        ..., env="ACCESS_TOKEN_EXPIRE_MINUTES"
-    )
-    refresh_token_expire_days: int = Field(
-        ..., env="REFRESH_TOKEN_EXPIRE_DAYS"
-    )
-    algorithm: str = Field(..., env="ALGORITHM")
-
-
-settings = Settings()
+settings = Settings.get()
+# Decoded payloads of verified tokens, keyed by the token digest and kept
+# until the token expires.
+token_cache = LocalCache(max_size=settings.token_cache_size, ttl=0)
+refresh_tokens = RedisRefreshTokenStore(settings.refresh_token_prefix)
+
+
+class Principal:
+    def __init__(
+        self, user_id: int, claims: dict, user: Optional[User] = None
+    ):
+        self.id = user_id
+        self.claims = claims
+        self._user = user
+
+    async def get_user(self, session: AsyncSession) -> User:
+        # The user may have been loaded by a replica session; writes need
+        # it attached to the session they commit through.
+        if self._user is None or self._user not in session:
+            with metrics.stage(metrics.DB):
+                user = await session.get(User, self.id)
+            if user is None:
+                raise CREDENTIAL_EXCEPTION
+            self._user = user
+        return self._user
 
 
 async def register(
@@ -45,32 +75,37 @@ async def register(
 ) -> GetUserScheme:
     user_dict: dict = user_data.dict(exclude_unset=True)
     user_dict["password"] = bytes(
-        pwd_context.hash(user_dict["password"]), encoding="utf-8"
+        await hashing.hash_password(user_dict["password"]), encoding="utf-8"
     )
     user = User(**user_dict)
     session.add(user)
 
-    await session.commit()
-    await session.refresh(user)
+    with metrics.stage(metrics.DB):
+        await session.commit()
+        await session.refresh(user)
+    await user_internal.forget_missing(user.id)
 
     return GetUserScheme.from_orm(user)
 
 
 async def login(session: AsyncSession, login_data: LoginScheme) -> AuthStatus:
-    user = (
-        await session.execute(
-            select(User).filter(User.phone == login_data.login).limit(1)
-        )
-    ).scalar()
+    with metrics.stage(metrics.DB):
+        user = (
+            await session.execute(
+                select(User).filter(User.phone == login_data.login).limit(1)
+            )
+        ).scalar()
     if not user:
         raise CREDENTIAL_EXCEPTION
-    if pwd_context.verify(login_data.password, user.password):
+    verified, new_hash = await hashing.verify_and_update(
+        login_data.password, user.password
+    )
+    if verified:
+        if new_hash is not None:
+            user.password = bytes(new_hash, encoding="utf-8")
+            with metrics.stage(metrics.DB):
+                await session.commit()
         tokens = await _create_tokens(user)
-        if user.refresh_token is None:
-            user.refresh_token = tokens["refresh"]
-            session.add(user)
-            await session.commit()
-
         return AuthStatus(
             access_token=tokens["access"],
             refresh_token=tokens["refresh"],
@@ -78,74 +113,132 @@ async def login(session: AsyncSession, login_data: LoginScheme) -> AuthStatus:
     raise CREDENTIAL_EXCEPTION
 
 
-async def get_current_user(
+async def get_current_principal(
     token: str = Depends(oauth2_scheme),
-    session: AsyncSession = Depends(get_async_session),
-) -> User:
-    try:
-        payload = jwt.decode(
-            token, settings.jwt_secret_key, algorithms=settings.algorithm
-        )
-    except JWTError:
+    session: AsyncSession = Depends(get_async_read_session),
+) -> Principal:
+    payload = _decode_access_token(token)
+    user_id = int(payload.get("sub"))
+    session = user_internal.read_session(session, user_id)
+    with metrics.stage(metrics.DB):
+        user = await session.get(User, user_id)
+    if user is None:
         raise CREDENTIAL_EXCEPTION
-    user = await session.get(User, int(payload.get("sub")))
-    if user is None or payload.get("purpose") != ACCESS_PURPOSE:
-        raise CREDENTIAL_EXCEPTION
-    else:
-        return user
+    return Principal(user_id, payload, user)
 
 
-async def refresh(
-    session: AsyncSession,
-    user: User,
-) -> AuthStatus:
-    tokens = await _create_tokens(user)
-    user.refresh_token = tokens["refresh"]
-    session.add(user)
-    await session.commit()
+async def get_admin_principal(
+    principal: Principal = Depends(get_current_principal),
+) -> Principal:
+    if principal.id not in settings.admin_user_ids:
+        raise ADMIN_REQUIRED_EXCEPTION
+    return principal
+
+
+async def get_token_principal(
+    token: str = Depends(oauth2_scheme),
+) -> Principal:
+    # For handlers that load the user through Principal.get_user anyway,
+    # which rejects deleted users itself: no query before the handler.
+    payload = _decode_access_token(token)
+    return Principal(int(payload.get("sub")), payload)
+
+
+async def refresh(principal: Principal) -> AuthStatus:
+    tokens = await _create_tokens(principal)
     return AuthStatus(
         access_token=tokens["access"],
         refresh_token=tokens["refresh"],
     )
 
 
-async def get_refresh_user(
+async def get_refresh_principal(
     token: str = Depends(oauth2_scheme),
-    session: AsyncSession = Depends(get_async_session),
-) -> User:
+) -> Principal:
+    payload = _decode_token(token)
+    if payload.get("purpose") != REFRESH_PURPOSE:
+        raise CREDENTIAL_EXCEPTION
+    user_id = int(payload.get("sub"))
+    # Rotation: the token is removed on first use, so a replayed or
+    # already rotated token is rejected.
     try:
-        payload = jwt.decode(
-            token, settings.jwt_secret_key, algorithms=settings.algorithm
-        )
-    except JWTError:
+        if "jti" in payload:
+            consumed = await refresh_tokens.consume(user_id, payload["jti"])
+        else:
+            # Issued before refresh tokens had a jti: valid once, and
+            # exchanged for a token that is in the store.
+            consumed = await refresh_tokens.consume_legacy(
+                user_id,
+                hashlib.sha256(token.encode()).hexdigest(),
+                max(1, math.ceil(payload.get("exp", 0) - time.time())),
+            )
+    except (aioredis.RedisError, OSError) as error:
+        logging.error(error.args)
+        raise TOKEN_STORE_UNAVAILABLE_EXCEPTION
+    if not consumed:
         raise CREDENTIAL_EXCEPTION
-    user = await session.get(User, int(payload.get("sub")))
-    if user is None or payload.get("purpose") != REFRESH_PURPOSE:
+    return Principal(user_id, payload)
+
+
+def _decode_access_token(token: str) -> dict:
+    payload = _decode_token(token)
+    if payload.get("purpose") != ACCESS_PURPOSE:
         raise CREDENTIAL_EXCEPTION
-    else:
-        return user
+    return payload
+
+
+def _decode_token(token: str) -> dict:
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        try:
+            with metrics.stage(metrics.TOKEN):
+                payload = jwt.decode(
+                    token,
+                    settings.jwt_secret_key,
+                    algorithms=settings.algorithm,
+                )
+        except JWTError:
+            raise CREDENTIAL_EXCEPTION
+        expires_in = payload.get("exp", 0) - time.time()
+        if expires_in > 0:
+            token_cache.set(key, payload, ttl=expires_in)
+    return payload
 
 
 async def _create_token(data: dict, expires_delta: datetime.timedelta) -> str:
     to_encode = data.copy()
     to_encode.update({"exp": datetime.datetime.utcnow() + expires_delta})
-    token = jwt.encode(
-        to_encode, settings.jwt_secret_key, algorithm=settings.algorithm
-    )
+    with metrics.stage(metrics.TOKEN):
+        token = jwt.encode(
+            to_encode, settings.jwt_secret_key, algorithm=settings.algorithm
+        )
     return token
 
 
-async def _create_tokens(user: User) -> dict:
+async def _create_tokens(user: Union[User, Principal]) -> dict:
+    jti = uuid.uuid4().hex
     access = await _create_token(
         data={"sub": str(user.id), "purpose": ACCESS_PURPOSE},
         expires_delta=datetime.timedelta(
             minutes=settings.access_token_expire_minutes
         ),
     )
+    refresh_lifetime = datetime.timedelta(
+        days=settings.refresh_token_expire_days
+    )
     refresh = await _create_token(
-        data={"sub": str(user.id), "purpose": REFRESH_PURPOSE},
-        expires_delta=datetime.timedelta(
-            days=settings.refresh_token_expire_days
-        ),
+        data={"sub": str(user.id), "purpose": REFRESH_PURPOSE, "jti": jti},
+        expires_delta=refresh_lifetime,
     )
+    # Fail closed, unlike the rate limiter: a refresh token that is not in
+    # the store could never be used, so no tokens are issued at all and
+    # the client is told to retry instead of getting a generic 500.
+    try:
+        await refresh_tokens.add(
+            user.id, jti, int(refresh_lifetime.total_seconds())
+        )
+    except (aioredis.RedisError, OSError) as error:
+        logging.error(error.args)
+        raise TOKEN_STORE_UNAVAILABLE_EXCEPTION
     return {"access": access, "refresh": refresh}
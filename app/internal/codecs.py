@@ -0,0 +1,111 @@
+import json
+from typing import Optional, Type
+
+from pydantic import BaseModel
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+class ModelCodec:
+    # Every payload starts with a codec marker and the schema version.
+    # Anything else (e.g. legacy pickles, which start with 0x80) is a miss.
+    marker: bytes = b""
+
+    def __init__(self, model: Type[BaseModel], schema_version: int):
+        self.model = model
+        self.fields = tuple(model.__fields__)
+        self.field_set = frozenset(self.fields)
+        self.header = self.marker + bytes([schema_version])
+
+    def encode(self, obj: BaseModel) -> bytes:
+        return self.header + self._dumps(obj)
+
+    def decode(self, payload: bytes) -> Optional[BaseModel]:
+        if not payload or not payload.startswith(self.header):
+            return None
+        try:
+            values = self._loads(payload[len(self.header) :])
+        except ValueError:
+            return None
+        if values.keys() != self.field_set:
+            return None
+        # Same as BaseModel.construct() without the defaults handling,
+        # which the field check above makes unnecessary.
+        obj = self.model.__new__(self.model)
+        object.__setattr__(obj, "__dict__", values)
+        object.__setattr__(obj, "__fields_set__", set(self.field_set))
+        return obj
+
+    def body(self, payload: bytes) -> Optional[bytes]:
+        # The entry as a JSON document, ready to be sent in a response.
+        obj = self.decode(payload)
+        if obj is None:
+            return None
+        return JSON_ENCODER.encode(obj.__dict__).encode()
+
+    def _dumps(self, obj: BaseModel) -> bytes:
+        raise NotImplementedError
+
+    def _loads(self, data: bytes) -> dict:
+        raise NotImplementedError
+
+
+class JSONCodec(ModelCodec):
+    marker = b"J"
+    encoder = JSON_ENCODER
+
+    def body(self, payload: bytes) -> Optional[bytes]:
+        # Everything after the header already is the JSON document; the
+        # schema version in the header stands in for the field check.
+        if not payload or not payload.startswith(self.header):
+            return None
+        return payload[len(self.header) :]
+
+    def _dumps(self, obj: BaseModel) -> bytes:
+        return self.encoder.encode(
+            {field: getattr(obj, field) for field in self.fields}
+        ).encode()
+
+    def _loads(self, data: bytes) -> dict:
+        values = json.loads(data)
+        if not isinstance(values, dict):
+            raise ValueError("Unexpected payload")
+        return values
+
+
+class MsgpackCodec(ModelCodec):
+    marker = b"M"
+
+    def __init__(self, model: Type[BaseModel], schema_version: int):
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        super().__init__(model, schema_version)
+
+    def _dumps(self, obj: BaseModel) -> bytes:
+        return msgpack.packb([getattr(obj, field) for field in self.fields])
+
+    def _loads(self, data: bytes) -> dict:
+        try:
+            values = msgpack.unpackb(data)
+        except Exception as error:
+            raise ValueError(error)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise ValueError("Unexpected payload")
+        return dict(zip(self.fields, values))
+
+
+CODECS = {
+    "json": JSONCodec,
+    "msgpack": MsgpackCodec,
+}
+
+
+def get_codec(
+    name: str, model: Type[BaseModel], schema_version: int
+) -> ModelCodec:
+    return CODECS[name](model, schema_version)
@@ -1,3 +1,6 @@
+import time
+from typing import Optional
+
 import aioredis
 
 from app.settings import Settings
@@ -5,5 +8,62 @@ from app.settings import Settings
 settings = Settings.get()
 
 
+class RedisConnectionPool(aioredis.BlockingConnectionPool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.waits = 0
+        self.wait_time = 0.0
+
+    async def get_connection(self, command_name, *keys, **options):
+        if self.pool.empty():
+            self.waits += 1
+            started = time.perf_counter()
+            try:
+                return await super().get_connection(
+                    command_name, *keys, **options
+                )
+            finally:
+                self.wait_time += time.perf_counter() - started
+        return await super().get_connection(command_name, *keys, **options)
+
+    def stats(self) -> dict:
+        # Free slots hold either an idle connection or a None placeholder
+        # for a connection that has not been opened yet.
+        in_use = self.max_connections - self.pool.qsize()
+        return {
+            "max_connections": self.max_connections,
+            "created": len(self._connections),
+            "in_use": in_use,
+            "idle": len(self._connections) - in_use,
+            "waits": self.waits,
+            "wait_time": self.wait_time,
+        }
+
+
+_pools: dict = {}
+
+
+def get_redis_pool(db_num: int = 0) -> RedisConnectionPool:
+    pool: Optional[RedisConnectionPool] = _pools.get(db_num)
+    if pool is None:
+        pool = RedisConnectionPool.from_url(
+            settings.redis_host,
+            db=db_num,
+            max_connections=settings.redis_max_connections,
+            timeout=settings.redis_pool_timeout,
+            socket_timeout=settings.redis_socket_timeout,
+            socket_connect_timeout=settings.redis_socket_connect_timeout,
+            health_check_interval=settings.redis_health_check_interval,
+        )
+        _pools[db_num] = pool
+    return pool
+
+
+async def close_redis_pools():
+    while _pools:
+        _, pool = _pools.popitem()
+        await pool.disconnect()
+
+
 async def get_async_redis(db_num: int = 0) -> aioredis.Redis:
-    return aioredis.from_url(settings.redis_host, db=db_num)
+    return aioredis.Redis(connection_pool=get_redis_pool(db_num))
@@ -0,0 +1,223 @@
+import asyncio
+import time
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.internal import metrics
+from app.settings import Settings
+
+settings = Settings.get()
+
+# Passwords per bulk submission: one chunk holds a worker for about a
+# second with the default bcrypt cost.
+BULK_CHUNK_SIZE = 4
+
+HASHING_OVERLOAD_EXCEPTION = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Сервер перегружен, повторите попытку позже",
+    headers={"Retry-After": "1"},
+)
+
+
+class HashingStats:
+    def __init__(self):
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+
+    def observe(self, queue_wait: float, hash_time: float, count: int = 1):
+        self.completed += count
+        self.queue_wait_total += queue_wait * count
+        self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+        self.hash_time_total += hash_time
+        self.hash_time_max = max(self.hash_time_max, hash_time / count)
+
+    def as_dict(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_wait_avg": self.queue_wait_total / completed,
+            "queue_wait_max": self.queue_wait_max,
+            "hash_time_avg": self.hash_time_total / completed,
+            "hash_time_max": self.hash_time_max,
+        }
+
+
+def build_context(settings: Settings) -> CryptContext:
+    # min_rounds == max_rounds makes needs_update() flag any hash whose cost
+    # differs from the configured one, not just other schemes.
+    bcrypt_rounds = settings.password_bcrypt_rounds
+    argon2_time_cost = settings.password_argon2_time_cost
+    return CryptContext(
+        schemes=settings.password_schemes,
+        deprecated="auto",
+        bcrypt__default_rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__time_cost=argon2_time_cost,
+        argon2__min_rounds=argon2_time_cost,
+        argon2__max_rounds=argon2_time_cost,
+        argon2__memory_cost=settings.password_argon2_memory_cost,
+        argon2__parallelism=settings.password_argon2_parallelism,
+    )
+
+
+stats = HashingStats()
+_pwd_context: Optional[CryptContext] = None
+_executor: Optional[Executor] = None
+
+
+def get_pwd_context() -> CryptContext:
+    global _pwd_context
+    if _pwd_context is None:
+        _pwd_context = build_context(settings)
+    return _pwd_context
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if settings.password_hash_executor == "process":
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.password_hash_workers
+            )
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.password_hash_workers,
+                thread_name_prefix="password-hash",
+            )
+    return _executor
+
+
+async def warm_up():
+    # Builds the context and loads the hashing backend in this process and
+    # in every executor worker, which for the process pool also starts them.
+    _load_context()
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    await asyncio.gather(
+        *(
+            loop.run_in_executor(executor, _load_context)
+            for _ in range(settings.password_hash_workers)
+        )
+    )
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def _load_context():
+    get_pwd_context().handler().get_backend()
+
+
+# Executed inside the pool, so they must stay top-level (picklable) and
+# report their own start time to separate queue wait from hashing time.
+def _hash(password: str) -> Tuple[str, float, float]:
+    started = time.perf_counter()
+    hashed = get_pwd_context().hash(password)
+    return hashed, started, time.perf_counter()
+
+
+def _hash_many(passwords: List[str]) -> Tuple[List[str], float, float]:
+    started = time.perf_counter()
+    context = get_pwd_context()
+    hashed = [context.hash(password) for password in passwords]
+    return hashed, started, time.perf_counter()
+
+
+def _verify(password: str, hashed: bytes) -> Tuple[bool, float, float]:
+    started = time.perf_counter()
+    verified = get_pwd_context().verify(password, hashed)
+    return verified, started, time.perf_counter()
+
+
+def _verify_and_update(
+    password: str, hashed: bytes
+) -> Tuple[Tuple[bool, Optional[str]], float, float]:
+    started = time.perf_counter()
+    result = get_pwd_context().verify_and_update(password, hashed)
+    return result, started, time.perf_counter()
+
+
+async def _submit(func, *args, count: int = 1):
+    if stats.pending >= settings.password_hash_queue_size:
+        stats.rejected += 1
+        raise HASHING_OVERLOAD_EXCEPTION
+    return await _run(func, *args, count=count)
+
+
+async def _run(func, *args, count: int = 1):
+    stats.pending += 1
+    loop = asyncio.get_running_loop()
+    submitted = time.perf_counter()
+    try:
+        with metrics.stage(metrics.PASSWORD_HASH):
+            result, started, finished = await loop.run_in_executor(
+                get_executor(), func, *args
+            )
+    finally:
+        stats.pending -= 1
+    stats.observe(started - submitted, finished - started, count)
+    return result
+
+
+async def hash_password(password: str) -> str:
+    return await _submit(_hash, password)
+
+
+async def verify_password(password: str, hashed: bytes) -> bool:
+    return await _submit(_verify, password, hashed)
+
+
+async def verify_and_update(
+    password: str, hashed: bytes
+) -> Tuple[bool, Optional[str]]:
+    return await _submit(_verify_and_update, password, hashed)
+
+
+async def hash_passwords(passwords: List[str]) -> List[str]:
+    # At most password_hash_bulk_workers small chunks are in the pool at a
+    # time, so a login or register queues behind a few chunks rather than
+    # the whole import. Chunks wait for the pool instead of being rejected
+    # by the queue limit, so an import is never cut short halfway;
+    # concurrent bulk callers are limited by the import route.
+    chunks = [
+        passwords[start : start + BULK_CHUNK_SIZE]
+        for start in range(0, len(passwords), BULK_CHUNK_SIZE)
+    ]
+    results: List[List[str]] = [[] for _ in chunks]
+    pending = iter(enumerate(chunks))
+
+    async def work():
+        for index, chunk in pending:
+            results[index] = await _run(_hash_many, chunk, count=len(chunk))
+
+    workers = [
+        asyncio.ensure_future(work())
+        for _ in range(settings.password_hash_bulk_workers)
+    ]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        # Cancelled: submit no further chunks.
+        for worker in workers:
+            worker.cancel()
+        raise
+    return [hashed for chunk in results for hashed in chunk]
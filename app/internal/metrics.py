@@ -0,0 +1,222 @@
+import asyncio
+import functools
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+DB = "db"
+REDIS = "redis"
+PASSWORD_HASH = "password_hash"
+TOKEN = "token"
+SERIALIZE = "serialize"
+ADMISSION = "admission"
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Tuple[str, ...],
+        buckets: Tuple[float, ...] = BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        # labels -> [count per bucket..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in self._series.items():
+            label_str = ",".join(
+                f'{name}="{value}"'
+                for name, value in zip(self.label_names, labels)
+            )
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield (
+                    f'{self.name}_bucket{{{label_str},le="{bound}"}} '
+                    f"{cumulative}"
+                )
+            cumulative += series[-2]
+            yield f'{self.name}_bucket{{{label_str},le="+Inf"}} {cumulative}'
+            yield f"{self.name}_sum{{{label_str}}} {series[-1]}"
+            yield f"{self.name}_count{{{label_str}}} {cumulative}"
+
+
+class RequestTimings:
+    __slots__ = ("route", "stages", "endpoint_finished")
+
+    def __init__(self):
+        self.route: Optional[str] = None
+        self.stages: Dict[str, float] = {}
+        self.endpoint_finished: Optional[float] = None
+
+    def add(self, stage_name: str, value: float):
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + value
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ("route", "method", "status"),
+)
+stage_latency = Histogram(
+    "http_request_stage_duration_seconds",
+    "Time spent in each stage of an HTTP request",
+    ("route", "stage"),
+)
+_collectors: List[Callable[[], Iterable[str]]] = []
+_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def stage(stage_name: str):
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(stage_name, time.perf_counter() - started)
+
+
+def register_collector(collector: Callable[[], Iterable[str]]):
+    _collectors.append(collector)
+
+
+def gauges(prefix: str, values: dict, documentation: str) -> Iterable[str]:
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        yield f"# HELP {name} {documentation}"
+        yield f"# TYPE {name} gauge"
+        yield f"{name} {float(value)}"
+
+
+def render() -> str:
+    lines: List[str] = []
+    lines.extend(request_latency.render())
+    lines.extend(stage_latency.render())
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _timings.reset(token)
+            # Unmatched paths are skipped to keep label cardinality bounded.
+            if timings.route is not None:
+                request_latency.observe(
+                    (timings.route, scope["method"], str(status_code)),
+                    elapsed,
+                )
+                for stage_name, value in timings.stages.items():
+                    stage_latency.observe((timings.route, stage_name), value)
+
+
+def _mark_endpoint_finished(call: Callable) -> Callable:
+    def finish():
+        timings = _timings.get()
+        if timings is not None:
+            timings.endpoint_finished = time.perf_counter()
+
+    if asyncio.iscoroutinefunction(call):
+
+        @functools.wraps(call)
+        async def async_endpoint(*args, **kwargs):
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                finish()
+
+        return async_endpoint
+
+    @functools.wraps(call)
+    def endpoint(*args, **kwargs):
+        try:
+            return call(*args, **kwargs)
+        finally:
+            finish()
+
+    return endpoint
+
+
+class InstrumentedRoute(APIRoute):
+    def get_route_handler(self):
+        self.dependant.call = _mark_endpoint_finished(self.dependant.call)
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        async def instrumented_handler(request):
+            timings = _timings.get()
+            if timings is None:
+                return await handler(request)
+            timings.route = route
+            response = await handler(request)
+            # Everything after the endpoint returns is response validation,
+            # encoding and rendering.
+            if timings.endpoint_finished is not None:
+                timings.add(
+                    SERIALIZE, time.perf_counter() - timings.endpoint_finished
+                )
+            return response
+
+        return instrumented_handler
@@ -0,0 +1,130 @@
+import logging
+import math
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import aioredis
+from fastapi import HTTPException, status
+
+import app.internal.deps as internal_deps
+from app.internal import metrics
+from app.settings import Settings
+
+settings = Settings.get()
+
+# Sliding window log per key: a sorted set of request timestamps. All keys
+# are checked first and the request is recorded in every window only if
+# none of them is full, so a rejected attempt does not extend the block.
+# KEYS: window keys; ARGV: now (ms), member, then limit and window (ms)
+# for each key. Returns 0 if allowed, otherwise milliseconds to wait.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2 + 1])
+    local window = tonumber(ARGV[i * 2 + 2])
+    redis.call("ZREMRANGEBYSCORE", key, "-inf", now - window)
+    if redis.call("ZCARD", key) >= limit then
+        local oldest = redis.call("ZRANGE", key, 0, 0, "WITHSCORES")
+        retry_after = math.max(retry_after, oldest[2] + window - now)
+    end
+end
+if retry_after > 0 then
+    return retry_after
+end
+for i, key in ipairs(KEYS) do
+    redis.call("ZADD", key, now, ARGV[2])
+    redis.call("PEXPIRE", key, ARGV[i * 2 + 2])
+end
+return 0
+"""
+
+
+class Limit:
+    def __init__(self, requests: int, window: float):
+        self.requests = requests
+        self.window_ms = int(window * 1000)
+
+    @classmethod
+    def parse(cls, spec: str) -> Optional["Limit"]:
+        if not spec:
+            return None
+        requests, window = spec.split("/")
+        if int(requests) < 1 or float(window) <= 0:
+            raise ValueError(f"Invalid rate limit {spec!r}")
+        return cls(int(requests), float(window))
+
+
+class RateLimitStats:
+    def __init__(self):
+        self.allowed = 0
+        self.rejected = 0
+        self.errors = 0
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        prefix: str,
+        rules: Dict[str, Dict[str, str]],
+        enabled: bool = True,
+    ):
+        self.prefix = prefix
+        self.enabled = enabled
+        self.rules = {
+            route: {key: Limit.parse(spec) for key, spec in limits.items()}
+            for route, limits in rules.items()
+        }
+        self.stats = RateLimitStats()
+        self._script = None
+
+    async def check(self, route: str, **values: str):
+        windows: List[Tuple[str, Limit]] = []
+        for name, value in values.items():
+            limit = self.rules[route].get(name)
+            if limit is not None and value:
+                windows.append(
+                    (f"{self.prefix}:{route}:{name}:{value}", limit)
+                )
+        if not self.enabled or not windows:
+            return
+
+        args = [int(time.time() * 1000), uuid.uuid4().hex]
+        for _, limit in windows:
+            args.extend((limit.requests, limit.window_ms))
+        try:
+            redis: aioredis.Redis = await internal_deps.get_async_redis()
+            with metrics.stage(metrics.REDIS):
+                retry_after = await self._get_script(redis)(
+                    keys=[key for key, _ in windows], args=args, client=redis
+                )
+        except (aioredis.RedisError, OSError) as error:
+            # Fail open: losing the limiter must not take logins down.
+            logging.error(error.args)
+            self.stats.errors += 1
+            return
+
+        if retry_after:
+            self.stats.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много попыток, повторите позже",
+                headers={"Retry-After": str(math.ceil(retry_after / 1000))},
+            )
+        self.stats.allowed += 1
+
+    def _get_script(self, redis: aioredis.Redis):
+        # get_async_redis returns a new client every time, so the Script is
+        # built (and the source hashed) once and run on the caller's client.
+        # It runs by EVALSHA and reloads itself if Redis lost the script.
+        if self._script is None:
+            self._script = redis.register_script(SLIDING_WINDOW_SCRIPT)
+        return self._script
+
+
+rate_limiter = RateLimiter(
+    settings.rate_limit_prefix,
+    settings.rate_limits,
+    enabled=settings.rate_limit_enabled,
+)
@@ -0,0 +1,48 @@
+import json
+from typing import Any, Type
+
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import BaseModel
+
+from app.settings import Settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+RESPONSE_CLASSES = {
+    "json": JSONResponse,
+    "orjson": ORJSONResponse,
+}
+# Same output as JSONResponse.render.
+JSON_ENCODER = json.JSONEncoder(
+    ensure_ascii=False, allow_nan=False, separators=(",", ":")
+)
+
+
+class RawJSONResponse(Response):
+    # The body is already a JSON document and is sent as is.
+    media_type = "application/json"
+
+
+def get_response_class(name: str) -> Type[JSONResponse]:
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("orjson is not installed")
+    return RESPONSE_CLASSES[name]
+
+
+settings = Settings.get()
+response_class = get_response_class(settings.response_class)
+
+
+def dumps(obj: Any) -> bytes:
+    if response_class is ORJSONResponse:
+        return orjson.dumps(obj)
+    return JSON_ENCODER.encode(obj).encode()
+
+
+def model_response(model: BaseModel) -> RawJSONResponse:
+    # For models the handler has just built and validated: skips the
+    # second validation against response_model and jsonable_encoder.
+    return RawJSONResponse(dumps(model.dict()))
@@ -0,0 +1,53 @@
+import aioredis
+
+import app.internal.deps as internal_deps
+from app.internal import metrics
+
+
+class RefreshTokenStore:
+    # Every issued refresh token is registered under its jti and removed
+    # when it is used, so a refresh token is valid exactly once.
+    async def add(self, user_id: int, jti: str, ttl: int):
+        raise NotImplementedError
+
+    async def consume(self, user_id: int, jti: str) -> bool:
+        raise NotImplementedError
+
+    # Tokens issued before the store existed were never added; each is
+    # marked as used on first use instead, until it would have expired.
+    async def consume_legacy(
+        self, user_id: int, token_id: str, ttl: int
+    ) -> bool:
+        raise NotImplementedError
+
+
+class RedisRefreshTokenStore(RefreshTokenStore):
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+
+    def _key(self, user_id: int, jti: str) -> str:
+        return f"{self.prefix}:refresh:{user_id}:{jti}"
+
+    async def add(self, user_id: int, jti: str, ttl: int):
+        redis: aioredis.Redis = await internal_deps.get_async_redis()
+        with metrics.stage(metrics.REDIS):
+            await redis.set(self._key(user_id, jti), b"1", ex=ttl)
+
+    async def consume(self, user_id: int, jti: str) -> bool:
+        redis: aioredis.Redis = await internal_deps.get_async_redis()
+        with metrics.stage(metrics.REDIS):
+            return bool(await redis.delete(self._key(user_id, jti)))
+
+    async def consume_legacy(
+        self, user_id: int, token_id: str, ttl: int
+    ) -> bool:
+        redis: aioredis.Redis = await internal_deps.get_async_redis()
+        with metrics.stage(metrics.REDIS):
+            return bool(
+                await redis.set(
+                    f"{self.prefix}:refresh-legacy:{user_id}:{token_id}",
+                    b"1",
+                    ex=ttl,
+                    nx=True,
+                )
+            )
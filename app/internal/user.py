@@ -1,16 +1,134 @@
-import pickle
-from typing import List
+import asyncio
+import base64
+import binascii
+import csv
+import hashlib
+import hmac
+import io
+import json
+import logging
+import random
+import uuid
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 import aioredis
-from sqlalchemy import select
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import (
+    Integer,
+    String,
+    and_,
+    any_,
+    bindparam,
+    func,
+    or_,
+    select,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
 
 import app.internal.deps as internal_deps
+from app.database import deps as database_deps
 from app.database.models.user import User
-from app.schemas.user import GetUserScheme, PutUserScheme
+from app.internal import hashing, metrics, responses
+from app.internal.cache import CacheCounters, LocalCache, SingleFlight
+from app.internal.codecs import get_codec
+from app.schemas.auth import PostUserScheme
+from app.schemas.user import (
+    GetUserScheme,
+    ImportFailureScheme,
+    PutUserScheme,
+    UsersImportScheme,
+    UsersPageScheme,
+)
+from app.settings import Settings
 
 PAGINATION_SIZE = 10
+PAGINATION_MAX_SIZE = 100
+
+INVALID_CURSOR_EXCEPTION = HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    detail="Invalid pagination cursor",
+)
+TOO_MANY_IDS_EXCEPTION = HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    detail="Too many user IDs requested",
+)
+IMPORT_LINE_TOO_LONG_EXCEPTION = HTTPException(
+    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    detail="Import line is too long",
+)
+
+# Bump whenever GetUserScheme changes so cached entries of the old shape
+# are treated as misses.
+USER_SCHEMA_VERSION = 1
+INVALIDATION_RETRY_DELAY = 1.0
+LOCK_POLL_INTERVAL = 0.01
+KEYSPACE_MEMORY_SAMPLES = 100
+KEYSPACE_MAX_KEYS = 100000
+EXPORT_FIELDS = ("id", "name", "phone")
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_JSON_ENCODER = json.JSONEncoder(
+    ensure_ascii=False, separators=(",", ":")
+)
+IMPORT_DUPLICATE_PHONE = "phone already exists"
+IMPORT_MAX_LINE = 64 * 1024
+# Negative cache entries: the Redis payload can never collide with a codec
+# header, the local tier stores a sentinel object.
+NOT_FOUND_PAYLOAD = b"\x00"
+NOT_FOUND = object()
+# Deletes the lock only if it is still held by the given token.
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class NegativeCounters:
+    def __init__(self):
+        self.hits = 0
+        self.stored = 0
+
+
+class StampedeCounters:
+    def __init__(self):
+        self.lock_acquired = 0
+        self.lock_waits = 0
+        self.lock_fallbacks = 0
+
+
+settings = Settings.get()
+# All keys of the user cache live under one namespace: entries under
+# "<prefix>:<version>:<id>", plus the lock keys and invalidation channel.
+USER_CACHE_NAMESPACE = (
+    f"{settings.user_cache_prefix}:{settings.user_cache_key_version}"
+)
+USER_INVALIDATION_CHANNEL = f"{USER_CACHE_NAMESPACE}:invalidate"
+local_cache = LocalCache(
+    max_size=settings.user_cache_local_size,
+    ttl=settings.user_cache_local_ttl,
+)
+# Users written within the replica pin window, here or in another worker
+# (learned from the invalidation channel); their reads go to the primary.
+recent_writes = LocalCache(
+    max_size=settings.db_replica_pin_size,
+    ttl=settings.db_replica_pin_window,
+)
+redis_counters = CacheCounters()
+single_flight = SingleFlight()
+stampede_counters = StampedeCounters()
+negative_counters = NegativeCounters()
+user_codec = get_codec(
+    settings.user_cache_codec, GetUserScheme, USER_SCHEMA_VERSION
+)
+_invalidation_listener: Optional[asyncio.Task] = None
 
 
 async def change_user(
@@ -23,9 +141,10 @@ async def change_user(
     for key in user_dict:
         setattr(user, key, user_dict[key])
     session.add(user)
-    await session.commit()
-    await session.refresh(user)
-    await redis.delete(str(user.id))
+    with metrics.stage(metrics.DB):
+        await session.commit()
+        await session.refresh(user)
+    await invalidate(redis, user.id)
     return GetUserScheme.from_orm(user)
 
 
@@ -33,25 +152,651 @@ async def get_by_id(
     session: AsyncSession,
     user_id: int,
 ) -> GetUserScheme:
+    return GetUserScheme.parse_raw(await get_json_by_id(session, user_id))
+
+
+async def get_json_by_id(
+    session: AsyncSession,
+    user_id: int,
+) -> bytes:
+    # Both cache tiers hold the user as the JSON document of the response,
+    # so a hit is sent without decoding or validating anything.
+    body = local_cache.get(user_id)
+    if body is NOT_FOUND:
+        negative_counters.hits += 1
+        raise NoResultFound
+    if body is not None:
+        return body
+
     redis: aioredis.Redis = await internal_deps.get_async_redis()
-    cache = await redis.get(str(user_id))
-    if cache:
-        user_info = pickle.loads(cache)
+    with metrics.stage(metrics.REDIS):
+        payload = await redis.get(_cache_key(user_id))
+    if payload == NOT_FOUND_PAYLOAD:
+        negative_counters.hits += 1
+        _remember_missing(user_id)
+        raise NoResultFound
+    body = user_codec.body(payload)
+    if body is not None:
+        redis_counters.hits += 1
     else:
-        user = await session.get(User, user_id)
-        if not user:
+        redis_counters.misses += 1
+        try:
+            body = await single_flight.do(
+                user_id, lambda: _load_user(session, redis, user_id)
+            )
+        except NoResultFound:
+            _remember_missing(user_id)
+            raise
+
+    local_cache.set(user_id, body)
+    return body
+
+
+async def _load_user(
+    session: AsyncSession, redis: aioredis.Redis, user_id: int
+) -> bytes:
+    if not settings.user_cache_lock:
+        return await _load_user_from_db(session, redis, user_id)
+
+    lock_key = _lock_key(user_id)
+    token = uuid.uuid4().hex
+    with metrics.stage(metrics.REDIS):
+        acquired = await redis.set(
+            lock_key, token, nx=True, px=settings.user_cache_lock_ttl
+        )
+    if acquired:
+        stampede_counters.lock_acquired += 1
+        try:
+            return await _load_user_from_db(session, redis, user_id)
+        finally:
+            with metrics.stage(metrics.REDIS):
+                await redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+    # Another worker is loading this user: wait for it to fill the cache,
+    # but never longer than the configured bound.
+    stampede_counters.lock_waits += 1
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.user_cache_lock_wait
+    while loop.time() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        with metrics.stage(metrics.REDIS):
+            payload = await redis.get(_cache_key(user_id))
+            locked = payload is None and await redis.exists(lock_key)
+        if payload == NOT_FOUND_PAYLOAD:
             raise NoResultFound
-        user_info = GetUserScheme.from_orm(user)
-        await redis.set(str(user_id), pickle.dumps(user_info))
+        body = user_codec.body(payload)
+        if body is not None:
+            return body
+        if not locked:
+            break
+    stampede_counters.lock_fallbacks += 1
+    return await _load_user_from_db(session, redis, user_id)
 
-    return user_info
 
+async def _load_user_from_db(
+    session: AsyncSession, redis: aioredis.Redis, user_id: int
+) -> bytes:
+    # Whatever is read here is cached for the full TTL, so it must not
+    # come from a replica that has not seen the latest write yet. Every
+    # coalesced caller waits on this load, so it runs on a session of its
+    # own rather than on the first caller's, which closes with its request.
+    session = database_deps.new_session(read_session(session, user_id))
+    async with session:
+        with metrics.stage(metrics.DB):
+            user = await session.get(User, user_id)
+    if not user:
+        negative_counters.stored += 1
+        with metrics.stage(metrics.REDIS):
+            await redis.set(
+                _cache_key(user_id), NOT_FOUND_PAYLOAD, px=_negative_ttl_ms()
+            )
+        raise NoResultFound
+    user_info = GetUserScheme.from_orm(user)
+    with metrics.stage(metrics.REDIS):
+        await redis.set(
+            _cache_key(user_id), user_codec.encode(user_info), px=_ttl_ms()
+        )
+    return _user_body(user_info)
 
-async def get_all(session: AsyncSession, id__gt: int) -> List[GetUserScheme]:
-    users = await session.execute(
-        select(User).offset(id__gt).limit(PAGINATION_SIZE)
-    )
 
-    return [
-        GetUserScheme.from_orm(db_user) for db_user in users.unique().scalars()
+async def get_many(
+    session: AsyncSession,
+    user_ids: List[int],
+) -> bytes:
+    if len(user_ids) > settings.users_batch_max_ids:
+        raise TOO_MANY_IDS_EXCEPTION
+
+    found: Dict[int, bytes] = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        body = local_cache.get(user_id)
+        if body is NOT_FOUND:
+            negative_counters.hits += 1
+        elif body is not None:
+            found[user_id] = body
+        else:
+            missing.append(user_id)
+
+    if missing:
+        redis: aioredis.Redis = await internal_deps.get_async_redis()
+        with metrics.stage(metrics.REDIS):
+            payloads = await redis.mget([_cache_key(i) for i in missing])
+        db_ids = []
+        for user_id, payload in zip(missing, payloads):
+            if payload == NOT_FOUND_PAYLOAD:
+                negative_counters.hits += 1
+                _remember_missing(user_id)
+                continue
+            body = user_codec.body(payload)
+            if body is not None:
+                redis_counters.hits += 1
+                found[user_id] = body
+                local_cache.set(user_id, body)
+            else:
+                redis_counters.misses += 1
+                db_ids.append(user_id)
+
+        if db_ids:
+            session = read_session(session, *db_ids)
+            with metrics.stage(metrics.DB):
+                db_users = await session.execute(
+                    select(User.id, User.name, User.phone).filter(
+                        User.id
+                        == any_(bindparam("ids", db_ids, ARRAY(Integer)))
+                    )
+                )
+            pipeline = redis.pipeline(transaction=False)
+            for db_user in db_users:
+                user_info = GetUserScheme.from_orm(db_user)
+                found[user_info.id] = _user_body(user_info)
+                local_cache.set(user_info.id, found[user_info.id])
+                pipeline.set(
+                    _cache_key(user_info.id),
+                    user_codec.encode(user_info),
+                    px=_ttl_ms(),
+                )
+            for user_id in db_ids:
+                if user_id not in found:
+                    negative_counters.stored += 1
+                    _remember_missing(user_id)
+                    pipeline.set(
+                        _cache_key(user_id),
+                        NOT_FOUND_PAYLOAD,
+                        px=_negative_ttl_ms(),
+                    )
+            with metrics.stage(metrics.REDIS):
+                await pipeline.execute()
+
+    return encode_batch(user_ids, found)
+
+
+def encode_batch(user_ids: List[int], found: Dict[int, bytes]) -> bytes:
+    # A UsersBatchScheme document, with the user documents spliced in.
+    items = [
+        (
+            b'{"id":%d,"found":true,"user":%s}' % (user_id, found[user_id])
+            if user_id in found
+            else b'{"id":%d,"found":false,"user":null}' % user_id
+        )
+        for user_id in user_ids
     ]
+    return b'{"items":[' + b",".join(items) + b"]}"
+
+
+def _user_body(user_info: GetUserScheme) -> bytes:
+    return responses.dumps(user_info.dict())
+
+
+def read_session(session: AsyncSession, *user_ids: int) -> AsyncSession:
+    if any(recent_writes.get(user_id) for user_id in user_ids):
+        return database_deps.primary_session(session)
+    return session
+
+
+def _forget_locally(user_id: int):
+    local_cache.delete(user_id)
+    recent_writes.set(user_id, True)
+
+
+async def invalidate(redis: aioredis.Redis, user_id: int):
+    _forget_locally(user_id)
+    with metrics.stage(metrics.REDIS):
+        if await redis.delete(_cache_key(user_id)):
+            redis_counters.evictions += 1
+        await redis.publish(USER_INVALIDATION_CHANNEL, str(user_id))
+
+
+async def forget_missing(user_id: int):
+    try:
+        redis: aioredis.Redis = await internal_deps.get_async_redis()
+        await invalidate(redis, user_id)
+    except (aioredis.RedisError, OSError) as error:
+        # Worst case a stale "not found" lives until its short TTL expires.
+        logging.error(error.args)
+        _forget_locally(user_id)
+
+
+async def forget_missing_many(user_ids: List[int]):
+    for user_id in user_ids:
+        _forget_locally(user_id)
+    try:
+        redis: aioredis.Redis = await internal_deps.get_async_redis()
+        pipeline = redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipeline.delete(_cache_key(user_id))
+            pipeline.publish(USER_INVALIDATION_CHANNEL, str(user_id))
+        with metrics.stage(metrics.REDIS):
+            await pipeline.execute()
+    except (aioredis.RedisError, OSError) as error:
+        logging.error(error.args)
+
+
+def cache_stats() -> dict:
+    return {
+        "local": local_cache.stats(),
+        "replica_pins": recent_writes.stats(),
+        "redis": redis_counters.as_dict(),
+        "negative": negative_counters.__dict__.copy(),
+        "stampede": {
+            "coalesced": single_flight.coalesced,
+            **stampede_counters.__dict__,
+        },
+    }
+
+
+def _cache_key(user_id: int) -> str:
+    return f"{USER_CACHE_NAMESPACE}:{user_id}"
+
+
+def _ttl_ms() -> int:
+    # Jitter spreads the expiry of entries cached at the same moment.
+    jitter = settings.user_cache_ttl_jitter
+    ttl = settings.user_cache_ttl * random.uniform(1 - jitter, 1 + jitter)
+    return int(ttl * 1000)
+
+
+def _remember_missing(user_id: int):
+    local_cache.set(
+        user_id,
+        NOT_FOUND,
+        ttl=min(
+            settings.user_cache_local_ttl, settings.user_cache_negative_ttl
+        ),
+    )
+
+
+def _negative_ttl_ms() -> int:
+    return int(settings.user_cache_negative_ttl * 1000)
+
+
+def _lock_key(user_id: int) -> str:
+    return f"{USER_CACHE_NAMESPACE}:lock:{user_id}"
+
+
+async def keyspace_stats(max_keys: int) -> dict:
+    redis: aioredis.Redis = await internal_deps.get_async_redis()
+    keys = 0
+    memory = 0
+    sampled = 0
+    cursor = None
+    # The namespace also holds lock keys, which are short-lived and few.
+    while cursor != 0 and keys < max_keys:
+        cursor, batch = await redis.scan(
+            cursor or 0, match=f"{USER_CACHE_NAMESPACE}:*", count=1000
+        )
+        keys += len(batch)
+        if batch and sampled < KEYSPACE_MEMORY_SAMPLES:
+            memory += await redis.memory_usage(batch[0]) or 0
+            sampled += 1
+    return {
+        "namespace": USER_CACHE_NAMESPACE,
+        "keys": keys,
+        "truncated": cursor != 0,
+        "approximate_memory": memory // sampled * keys if sampled else 0,
+        "hit_ratio": redis_counters.as_dict()["hit_ratio"],
+    }
+
+
+async def listen_invalidations():
+    while True:
+        try:
+            redis: aioredis.Redis = await internal_deps.get_async_redis()
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(USER_INVALIDATION_CHANNEL)
+                # Messages published while we were disconnected are lost.
+                local_cache.clear()
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1.0
+                    )
+                    if message is not None:
+                        _forget_locally(int(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            logging.error(error.args)
+            local_cache.clear()
+            await asyncio.sleep(INVALIDATION_RETRY_DELAY)
+
+
+def start_invalidation_listener():
+    global _invalidation_listener
+    if _invalidation_listener is None:
+        _invalidation_listener = asyncio.create_task(listen_invalidations())
+
+
+async def stop_invalidation_listener():
+    global _invalidation_listener
+    if _invalidation_listener is not None:
+        _invalidation_listener.cancel()
+        try:
+            await _invalidation_listener
+        except asyncio.CancelledError:
+            pass
+        _invalidation_listener = None
+
+
+def encode_cursor(user_id: int) -> str:
+    return base64.urlsafe_b64encode(str(user_id).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise INVALID_CURSOR_EXCEPTION
+
+
+async def get_all(
+    session: AsyncSession,
+    cursor: Optional[str] = None,
+    limit: int = PAGINATION_SIZE,
+    offset: Optional[int] = None,
+) -> UsersPageScheme:
+    limit = min(limit, PAGINATION_MAX_SIZE)
+    query = select(User).order_by(User.id).limit(limit + 1)
+    if offset is not None:
+        query = query.offset(offset)
+    elif cursor is not None:
+        query = query.filter(User.id > decode_cursor(cursor))
+    with metrics.stage(metrics.DB):
+        db_users = (await session.execute(query)).scalars().all()
+
+    next_cursor = None
+    if len(db_users) > limit:
+        db_users = db_users[:limit]
+        next_cursor = encode_cursor(db_users[-1].id)
+
+    return UsersPageScheme(
+        items=[GetUserScheme.from_orm(db_user) for db_user in db_users],
+        next_cursor=next_cursor,
+    )
+
+
+def _sign_search_cursor(value: str) -> str:
+    return hmac.new(
+        settings.jwt_secret_key.encode(), value.encode(), hashlib.sha256
+    ).hexdigest()
+
+
+# Signed because the cursor carries the number of results already
+# returned, which the users_search_max_results cap relies on.
+def encode_search_cursor(
+    mode: str, returned: int, user_id: int, score: Optional[float]
+) -> str:
+    value = f"{mode}:{returned}:{user_id}:{'' if score is None else score}"
+    value = f"{value}:{_sign_search_cursor(value)}"
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_search_cursor(
+    cursor: str, mode: str
+) -> Tuple[int, int, Optional[float]]:
+    try:
+        value, _, signature = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().rpartition(":")
+        )
+        if not hmac.compare_digest(signature, _sign_search_cursor(value)):
+            raise ValueError(cursor)
+        cursor_mode, returned, user_id, score = value.split(":")
+        returned = int(returned)
+        if (
+            cursor_mode != mode
+            or returned < 0
+            or (mode == "fuzzy") != bool(score)
+        ):
+            raise ValueError(cursor)
+        return returned, int(user_id), float(score) if score else None
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise INVALID_CURSOR_EXCEPTION
+
+
+def _escape_like(value: str) -> str:
+    # "/" is the escape character SQLAlchemy's autoescape uses as well.
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def search_query(
+    query: str,
+    mode: str = "prefix",
+    last_id: Optional[int] = None,
+    last_score: Optional[float] = None,
+) -> Select:
+    if mode == "fuzzy":
+        # Name similarity above pg_trgm.similarity_threshold, best first.
+        score = func.similarity(User.name, query)
+        statement = (
+            select(User.id, User.name, User.phone, score.label("score"))
+            .filter(User.name.op("%")(query))
+            .order_by(score.desc(), User.id)
+        )
+        if last_id is not None:
+            statement = statement.filter(
+                or_(
+                    score < last_score,
+                    and_(score == last_score, User.id > last_id),
+                )
+            )
+        return statement
+
+    # Name prefix or any fragment of the phone number; both patterns are
+    # served by the trigram indexes.
+    pattern = _escape_like(query)
+    statement = (
+        select(User.id, User.name, User.phone)
+        .filter(
+            or_(
+                User.name.ilike(f"{pattern}%", escape="/"),
+                User.phone.like(f"%{pattern}%", escape="/"),
+            )
+        )
+        .order_by(User.id)
+    )
+    if last_id is not None:
+        statement = statement.filter(User.id > last_id)
+    return statement
+
+
+async def search(
+    session: AsyncSession,
+    query: str,
+    mode: str = "prefix",
+    cursor: Optional[str] = None,
+    limit: int = PAGINATION_SIZE,
+) -> UsersPageScheme:
+    returned, last_id, last_score = 0, None, None
+    if cursor is not None:
+        returned, last_id, last_score = decode_search_cursor(cursor, mode)
+    limit = min(
+        limit,
+        PAGINATION_MAX_SIZE,
+        settings.users_search_max_results - returned,
+    )
+    if limit <= 0:
+        return UsersPageScheme(items=[], next_cursor=None)
+
+    statement = search_query(query, mode, last_id, last_score)
+    with metrics.stage(metrics.DB):
+        rows = (await session.execute(statement.limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if returned + limit < settings.users_search_max_results:
+            last = rows[-1]
+            next_cursor = encode_search_cursor(
+                mode,
+                returned + limit,
+                last.id,
+                last.score if mode == "fuzzy" else None,
+            )
+
+    return UsersPageScheme(
+        items=[GetUserScheme.from_orm(row) for row in rows],
+        next_cursor=next_cursor,
+    )
+
+
+async def export_users(
+    session: AsyncSession, export_format: str
+) -> AsyncIterator[bytes]:
+    batch_size = settings.users_export_batch_size
+    # Server-side cursor: rows are fetched batch_size at a time, and the
+    # next batch is only requested after the previous chunk was sent, so
+    # memory stays flat and a slow client throttles the query.
+    query = (
+        select(User.id, User.name, User.phone)
+        .order_by(User.id)
+        .execution_options(yield_per=batch_size)
+    )
+    encode = _encode_csv if export_format == "csv" else _encode_ndjson
+    if export_format == "csv":
+        yield _encode_csv([EXPORT_FIELDS])
+    result = await session.stream(query)
+    async for rows in result.partitions(batch_size):
+        yield encode(rows)
+
+
+def _encode_ndjson(rows) -> bytes:
+    return "".join(
+        EXPORT_JSON_ENCODER.encode(dict(zip(EXPORT_FIELDS, row))) + "\n"
+        for row in rows
+    ).encode()
+
+
+def _encode_csv(rows) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+async def import_users(
+    session: AsyncSession, chunks: AsyncIterator[bytes]
+) -> UsersImportScheme:
+    summary = UsersImportScheme()
+    batch: List[Tuple[int, PostUserScheme]] = []
+    async for line_number, line in _read_lines(chunks):
+        summary.received += 1
+        try:
+            batch.append((line_number, PostUserScheme.parse_raw(line)))
+        except ValidationError as error:
+            reason = "; ".join(
+                f"{'.'.join(map(str, item['loc']))}: {item['msg']}"
+                for item in error.errors()
+            )
+            summary.failed.append(
+                ImportFailureScheme(line=line_number, reason=reason)
+            )
+            continue
+        if len(batch) >= settings.users_import_batch_size:
+            await _import_batch(session, batch, summary)
+            batch = []
+    if batch:
+        await _import_batch(session, batch, summary)
+    summary.failed.sort(key=lambda failure: failure.line)
+    return summary
+
+
+async def _read_lines(
+    chunks: AsyncIterator[bytes],
+) -> AsyncIterator[Tuple[int, bytes]]:
+    line_number = 0
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        if len(buffer) > IMPORT_MAX_LINE:
+            raise IMPORT_LINE_TOO_LONG_EXCEPTION
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield line_number, line
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+
+async def _import_batch(
+    session: AsyncSession,
+    batch: List[Tuple[int, PostUserScheme]],
+    summary: UsersImportScheme,
+):
+    def reject(line_number: int, phone: str):
+        summary.failed.append(
+            ImportFailureScheme(
+                line=line_number, phone=phone, reason=IMPORT_DUPLICATE_PHONE
+            )
+        )
+
+    accepted: Dict[str, Tuple[int, PostUserScheme]] = {}
+    for line_number, record in batch:
+        if record.phone in accepted:
+            reject(line_number, record.phone)
+        else:
+            accepted[record.phone] = (line_number, record)
+
+    phones = bindparam("phones", list(accepted), ARRAY(String))
+    with metrics.stage(metrics.DB):
+        result = await session.execute(
+            select(User.phone).filter(User.phone == any_(phones))
+        )
+        existing = set(result.scalars())
+        # Ends the read transaction, so the connection goes back to the
+        # pool instead of idling in a transaction while passwords hash.
+        await session.rollback()
+    for phone in existing:
+        reject(accepted.pop(phone)[0], phone)
+    if not accepted:
+        return
+
+    records = list(accepted.values())
+    hashed = await hashing.hash_passwords(
+        [record.password for _, record in records]
+    )
+    # The pre-check above reports existing phones; ON CONFLICT, backed by
+    # the unique index on phone, covers rows inserted concurrently.
+    query = (
+        insert(User)
+        .values(
+            [
+                {
+                    "name": record.name,
+                    "phone": record.phone,
+                    "password": bytes(password, encoding="utf-8"),
+                }
+                for (_, record), password in zip(records, hashed)
+            ]
+        )
+        .on_conflict_do_nothing()
+        .returning(User.id, User.phone)
+    )
+    with metrics.stage(metrics.DB):
+        created = {
+            phone: user_id for user_id, phone in (await session.execute(query))
+        }
+        await session.commit()
+
+    for line_number, record in records:
+        if record.phone not in created:
+            reject(line_number, record.phone)
+    summary.created += len(created)
+    await forget_missing_many(list(created.values()))
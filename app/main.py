@@ -1,9 +1,78 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+
 from fastapi import APIRouter, FastAPI
 
-from app.routers import auth, user
+from app.database import deps as database_deps
+from app.internal import deps as internal_deps
+from app.internal import hashing, responses
+from app.internal import user as user_internal
+from app.internal.metrics import MetricsMiddleware, gauges, register_collector
+from app.routers import auth, metrics, ops, user
+from app.settings import Settings
+
+# Seconds spent in each start-up phase of this worker.
+startup_timings: Dict[str, float] = {}
+
+
+def collect_startup():
+    yield from gauges(
+        "worker_startup_seconds", startup_timings, "Worker start-up time"
+    )
+
+
+register_collector(collect_startup)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything a worker holds open is created here, after the server has
+    # forked, and is ready before the first request is accepted.
+    settings = Settings.get()
+    started = time.perf_counter()
+    await database_deps.warm_up_engine(settings.db_pool_prewarm)
+    startup_timings["database"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    redis = await internal_deps.get_async_redis()
+    await redis.ping()
+    user_internal.start_invalidation_listener()
+    startup_timings["redis"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await hashing.warm_up()
+    startup_timings["hashing"] = time.perf_counter() - started
+    # Logged next to uvicorn's own "Application startup complete".
+    logging.getLogger("uvicorn.error").info(
+        "Worker start-up: %s",
+        ", ".join(
+            f"{phase} {seconds:.3f}s"
+            for phase, seconds in startup_timings.items()
+        ),
+    )
+    try:
+        yield
+    finally:
+        await user_internal.stop_invalidation_listener()
+        await internal_deps.close_redis_pools()
+        await database_deps.dispose_engine()
+        hashing.shutdown_executor()
+
 
-app = FastAPI()
-main_router = APIRouter(prefix="/api/v1")
-main_router.include_router(user.router)
-main_router.include_router(auth.router)
-app.include_router(main_router)
+def create_app() -> FastAPI:
+    started = time.perf_counter()
+    Settings.get().check_required()
+    app = FastAPI(default_response_class=responses.response_class)
+    # FastAPI 0.70 has no lifespan argument; Starlette's router does.
+    app.router.lifespan_context = lifespan
+    main_router = APIRouter(prefix="/api/v1")
+    main_router.include_router(user.router)
+    main_router.include_router(auth.router)
+    main_router.include_router(ops.router)
+    app.include_router(main_router)
+    app.include_router(metrics.router)
+    app.add_middleware(MetricsMiddleware)
+    startup_timings["create_app"] = time.perf_counter() - started
+    return app
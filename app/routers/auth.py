@@ -1,12 +1,14 @@
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.deps import get_async_session
-from app.database.models.user import User
 from app.internal import auth as auth_internal
-from app.internal.auth import get_refresh_user
+from app.internal.admission import controllers as admission
+from app.internal.auth import Principal, get_refresh_principal
+from app.internal.metrics import InstrumentedRoute
+from app.internal.ratelimit import rate_limiter
 from app.schemas.auth import AuthStatus, LoginScheme, PostUserScheme
 from app.schemas.message import Message
 from app.schemas.user import GetUserScheme
@@ -14,6 +16,7 @@ from app.schemas.user import GetUserScheme
 router = APIRouter(
     prefix="/auth",
     tags=["auth"],
+    route_class=InstrumentedRoute,
 )
 
 
@@ -21,13 +24,19 @@ router = APIRouter(
     "/register",
     summary="Регистрация нового пользователя",
     response_model=GetUserScheme,
+    responses={429: {"model": Message}, 503: {"model": Message}},
 )
 async def register(
+    request: Request,
     register_data: PostUserScheme,
     session: AsyncSession = Depends(get_async_session),
 ):
     try:
-        return await auth_internal.register(session, register_data)
+        await rate_limiter.check(
+            "register", phone=register_data.phone, ip=_client_ip(request)
+        )
+        async with admission["auth"].slot():
+            return await auth_internal.register(session, register_data)
     except HTTPException as http_error:
         logging.error(http_error.args)
         raise http_error
@@ -43,14 +52,23 @@ async def register(
     "/login",
     response_model=AuthStatus,
     summary="Авторизация существующего пользователя",
-    responses={403: {"model": Message}},
+    responses={
+        403: {"model": Message},
+        429: {"model": Message},
+        503: {"model": Message},
+    },
 )
 async def login(
+    request: Request,
     login_data: LoginScheme,
     session: AsyncSession = Depends(get_async_session),
 ):
     try:
-        return await auth_internal.login(session, login_data)
+        await rate_limiter.check(
+            "login", phone=login_data.login, ip=_client_ip(request)
+        )
+        async with admission["auth"].slot():
+            return await auth_internal.login(session, login_data)
     except HTTPException as http_error:
         logging.error(http_error.args)
         raise http_error
@@ -67,14 +85,13 @@ async def login(
     response_model=AuthStatus,
     summary="Получение новых токенов",
     description="Принимает Refresh в качестве Authorization Token",
-    responses={403: {"model": Message}},
+    responses={403: {"model": Message}, 503: {"model": Message}},
 )
 async def refresh(
-    user: User = Depends(get_refresh_user),
-    session: AsyncSession = Depends(get_async_session),
+    principal: Principal = Depends(get_refresh_principal),
 ):
     try:
-        return await auth_internal.refresh(session, user)
+        return await auth_internal.refresh(principal)
     except HTTPException as http_error:
         logging.error(http_error.args)
         raise http_error
@@ -84,3 +101,9 @@ async def refresh(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Внутренная ошибка сервера",
         )
+
+
+def _client_ip(request: Request) -> str:
+    # Behind a proxy run uvicorn with --proxy-headers so this is the real
+    # client address.
+    return request.client.host if request.client else ""
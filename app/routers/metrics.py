@@ -0,0 +1,57 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.database import deps as database_deps
+from app.internal import auth as auth_internal
+from app.internal import deps as internal_deps
+from app.internal import hashing, metrics
+from app.internal import user as user_internal
+from app.internal.admission import controllers as admission
+from app.internal.ratelimit import rate_limiter
+
+router = APIRouter()
+
+
+def collect_resources():
+    yield from metrics.gauges(
+        "password_hash", hashing.stats.as_dict(), "Password hashing executor"
+    )
+    for role, engine in database_deps.engines().items():
+        name = "db_pool" if role == "primary" else f"db_{role}_pool"
+        yield from metrics.gauges(
+            name, engine.pool.stats(), f"Postgres {role} pool"
+        )
+    yield from metrics.gauges(
+        "redis_pool", internal_deps.get_redis_pool().stats(), "Redis pool"
+    )
+    for tier, stats in user_internal.cache_stats().items():
+        yield from metrics.gauges(
+            f"user_cache_{tier}", stats, "User cache " + tier
+        )
+    yield from metrics.gauges(
+        "token_cache", auth_internal.token_cache.stats(), "Token cache"
+    )
+    yield from metrics.gauges(
+        "rate_limit", rate_limiter.stats.__dict__, "Rate limiter decisions"
+    )
+    for route, controller in admission.items():
+        yield from metrics.gauges(
+            f"admission_{route}",
+            controller.as_dict(),
+            f"Admission control for {route}",
+        )
+
+
+metrics.register_collector(collect_resources)
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+)
+async def get_metrics():
+    return PlainTextResponse(
+        metrics.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
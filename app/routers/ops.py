@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends, Query
+
+from app.database import deps as database_deps
+from app.internal import auth as auth_internal
+from app.internal import deps as internal_deps
+from app.internal import user as user_internal
+from app.internal.auth import get_admin_principal
+from app.internal.metrics import InstrumentedRoute
+from app.schemas.message import Message
+
+router = APIRouter(
+    prefix="/ops",
+    tags=["ops"],
+    route_class=InstrumentedRoute,
+    dependencies=[Depends(get_admin_principal)],
+    responses={401: {"model": Message}, 403: {"model": Message}},
+)
+
+
+@router.get(
+    "/database",
+    summary="Состояние пула соединений Postgres",
+)
+async def database_pool_stats():
+    return database_deps.get_engine().pool.stats()
+
+
+@router.get(
+    "/database/replica",
+    summary="Состояние пула соединений реплики Postgres",
+    description="Без настроенной реплики совпадает с /ops/database",
+)
+async def database_replica_pool_stats():
+    return database_deps.get_replica_engine().pool.stats()
+
+
+@router.get(
+    "/redis",
+    summary="Состояние пула соединений Redis",
+)
+async def redis_pool_stats():
+    return internal_deps.get_redis_pool().stats()
+
+
+@router.get(
+    "/cache",
+    summary="Статистика кэша пользователей",
+)
+async def user_cache_stats():
+    return {
+        **user_internal.cache_stats(),
+        "tokens": auth_internal.token_cache.stats(),
+    }
+
+
+@router.get(
+    "/cache/keyspace",
+    summary="Размер пространства ключей кэша пользователей в Redis",
+)
+async def user_cache_keyspace(
+    max_keys: int = Query(
+        100000,
+        ge=1,
+        le=user_internal.KEYSPACE_MAX_KEYS,
+        description="Максимум просматриваемых ключей",
+    ),
+):
+    return await user_internal.keyspace_stats(max_keys)
@@ -1,24 +1,187 @@
 import logging
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import HTTP_403_FORBIDDEN
 
-from app.database.deps import get_async_session
-from app.database.models.user import User
+from app.database.deps import get_async_read_session, get_async_session
 from app.internal import user as user_internal
-from app.internal.auth import get_current_user
+from app.internal.admission import controllers as admission
+from app.internal.auth import (
+    Principal,
+    get_admin_principal,
+    get_token_principal,
+)
+from app.internal.metrics import InstrumentedRoute
+from app.internal.responses import RawJSONResponse, model_response
 from app.schemas.message import Message
-from app.schemas.user import GetUserScheme, PutUserScheme
+from app.schemas.user import (
+    GetUserScheme,
+    PutUserScheme,
+    UsersBatchScheme,
+    UsersImportScheme,
+    UsersPageScheme,
+)
 
 router = APIRouter(
     prefix="/users",
     tags=["users"],
+    route_class=InstrumentedRoute,
 )
 
 
+@router.get(
+    "/batch",
+    response_model=UsersBatchScheme,
+    responses={422: {"model": Message}},
+    summary="Получение нескольких пользователей по списку ID",
+    description="Результаты возвращаются в порядке запроса, "
+    "для несуществующих пользователей found=false",
+)
+async def get_user_batch(
+    ids: List[int] = Query(..., description="ID пользователей"),
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    try:
+        return RawJSONResponse(await user_internal.get_many(session, ids))
+    except HTTPException as http_error:
+        logging.error(http_error.args)
+        raise http_error
+    except Exception as error:
+        logging.error(error.args)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Внутренная ошибка сервера",
+        )
+
+
+@router.get(
+    "/search",
+    response_model=UsersPageScheme,
+    responses={422: {"model": Message}},
+    summary="Поиск пользователей по имени и телефону",
+    description="prefix: имя начинается с q или телефон содержит q, "
+    "по возрастанию ID; fuzzy: имена, похожие на q, начиная с самых "
+    "похожих. Для следующей страницы передайте next_cursor из "
+    "предыдущего ответа; всего выдаётся не больше "
+    f"{user_internal.settings.users_search_max_results} результатов",
+)
+async def search_users(
+    q: str = Query(
+        ..., min_length=2, max_length=100, description="Строка поиска"
+    ),
+    mode: str = Query(
+        "prefix",
+        regex="^(prefix|fuzzy)$",
+        description="Режим поиска: prefix или fuzzy",
+    ),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы"
+    ),
+    limit: int = Query(
+        user_internal.PAGINATION_SIZE,
+        ge=1,
+        description="Размер страницы, не более "
+        f"{user_internal.PAGINATION_MAX_SIZE}",
+    ),
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    try:
+        return model_response(
+            await user_internal.search(session, q, mode, cursor, limit)
+        )
+    except HTTPException as http_error:
+        logging.error(http_error.args)
+        raise http_error
+    except Exception as error:
+        logging.error(error.args)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Внутренная ошибка сервера",
+        )
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    dependencies=[Depends(get_admin_principal)],
+    responses={
+        200: {
+            "content": {
+                media_type: {}
+                for media_type in user_internal.EXPORT_MEDIA_TYPES.values()
+            }
+        },
+        401: {"model": Message},
+        403: {"model": Message},
+    },
+    summary="Выгрузка всех пользователей",
+    description="Потоковая выгрузка всей таблицы пользователей "
+    "в формате NDJSON или CSV по возрастанию ID. "
+    "Только для администраторов",
+)
+async def export_users(
+    export_format: str = Query(
+        "ndjson",
+        alias="format",
+        regex="^(ndjson|csv)$",
+        description="Формат выгрузки: ndjson или csv",
+    ),
+    session: AsyncSession = Depends(get_async_read_session),
+):
+    return StreamingResponse(
+        user_internal.export_users(session, export_format),
+        media_type=user_internal.EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": "attachment; "
+            f'filename="users.{export_format}"'
+        },
+    )
+
+
+@router.post(
+    "/import",
+    response_model=UsersImportScheme,
+    dependencies=[Depends(get_admin_principal)],
+    responses={
+        401: {"model": Message},
+        403: {"model": Message},
+        422: {"model": Message},
+        503: {"model": Message},
+    },
+    summary="Массовая регистрация пользователей",
+    description="Тело запроса в формате NDJSON: по одному объекту "
+    "name/phone/password на строку. Строки с ошибками и уже занятыми "
+    "номерами телефонов пропускаются и перечисляются в failed. "
+    "Только для администраторов",
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/x-ndjson": {}},
+            "required": True,
+        }
+    },
+)
+async def import_users(
+    request: Request,
+    session: AsyncSession = Depends(get_async_session),
+):
+    try:
+        async with admission["import"].slot():
+            return await user_internal.import_users(session, request.stream())
+    except HTTPException as http_error:
+        logging.error(http_error.args)
+        raise http_error
+    except Exception as error:
+        logging.error(error.args)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Внутренная ошибка сервера",
+        )
+
+
 @router.get(
     "/{user_id}",
     response_model=GetUserScheme,
@@ -27,10 +190,12 @@ router = APIRouter(
 )
 async def get_user(
     user_id: int = Query(0, description="ID пользователя"),
-    session: AsyncSession = Depends(get_async_session),
+    session: AsyncSession = Depends(get_async_read_session),
 ):
     try:
-        return await user_internal.get_by_id(session, user_id)
+        return RawJSONResponse(
+            await user_internal.get_json_by_id(session, user_id)
+        )
     except HTTPException as http_error:
         logging.error(http_error.args)
         raise http_error
@@ -49,15 +214,44 @@ async def get_user(
 
 @router.get(
     "",
-    response_model=List[GetUserScheme],
+    response_model=UsersPageScheme,
+    responses={422: {"model": Message}},
     summary="Получение списка всех пользователей",
+    description="Постраничная выдача по возрастанию ID. Для следующей "
+    "страницы передайте next_cursor из предыдущего ответа",
 )
 async def get_user_all(
-    session: AsyncSession = Depends(get_async_session),
-    id__gt: int = Query(0, description="Пропустить N значений"),
+    session: AsyncSession = Depends(get_async_read_session),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы"
+    ),
+    limit: int = Query(
+        user_internal.PAGINATION_SIZE,
+        ge=1,
+        description="Размер страницы, не более "
+        f"{user_internal.PAGINATION_MAX_SIZE}",
+    ),
+    offset: Optional[int] = Query(
+        None,
+        ge=0,
+        description="Пропустить N значений (устаревший режим, "
+        "используйте cursor)",
+    ),
+    id__gt: Optional[int] = Query(
+        None,
+        ge=0,
+        deprecated=True,
+        description="Старое имя offset, используйте cursor",
+    ),
 ):
+    # id__gt was an offset despite its name; old clients paging with it
+    # keep getting the pages they expect.
+    if offset is None:
+        offset = id__gt
     try:
-        return await user_internal.get_all(session, id__gt)
+        return model_response(
+            await user_internal.get_all(session, cursor, limit, offset)
+        )
     except HTTPException as http_error:
         logging.error(http_error.args)
         raise http_error
@@ -78,14 +272,15 @@ async def get_user_all(
 async def put_user(
     user_id: int,
     user_info: PutUserScheme,
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_token_principal),
     session: AsyncSession = Depends(get_async_session),
 ):
-    if user.id != user_id:
+    if principal.id != user_id:
         raise HTTPException(
             status_code=HTTP_403_FORBIDDEN, detail="Unautorized"
         )
     try:
+        user = await principal.get_user(session)
         return await user_internal.change_user(session, user, user_info)
     except HTTPException as http_error:
         logging.error(http_error.args)
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -15,3 +15,30 @@ class GetUserScheme(BaseModel):
 class PutUserScheme(BaseModel):
     name: Optional[str]
     phone: Optional[str]
+
+
+class UsersPageScheme(BaseModel):
+    items: List[GetUserScheme]
+    next_cursor: Optional[str]
+
+
+class BatchUserScheme(BaseModel):
+    id: int
+    found: bool
+    user: Optional[GetUserScheme]
+
+
+class UsersBatchScheme(BaseModel):
+    items: List[BatchUserScheme]
+
+
+class ImportFailureScheme(BaseModel):
+    line: int
+    phone: Optional[str]
+    reason: str
+
+
+class UsersImportScheme(BaseModel):
+    received: int = 0
+    created: int = 0
+    failed: List[ImportFailureScheme] = []
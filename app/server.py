@@ -0,0 +1,98 @@
+import argparse
+import logging
+from importlib.util import find_spec
+from os import environ
+
+import uvicorn
+
+from app.settings import Settings
+
+APP = "app.main:create_app"
+
+logger = logging.getLogger("app.server")
+
+
+def installed(module: str) -> bool:
+    return find_spec(module) is not None
+
+
+def run_gunicorn(settings: Settings, host: str, port: int, workers: int):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        # SIGHUP starts a new set of workers and retires the old ones once
+        # they have finished their requests (up to graceful_timeout), so a
+        # deploy or config change never drops the listening socket.
+        def load_config(self):
+            options = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "worker_class": "uvicorn.workers.UvicornWorker",
+                "graceful_timeout": settings.server_graceful_timeout,
+                "keepalive": settings.server_keepalive,
+                "max_requests": settings.server_max_requests,
+                "max_requests_jitter": settings.server_max_requests_jitter,
+                # The app is built in every worker after the fork; its
+                # lifespan then opens that worker's own DB and Redis pools.
+                "preload_app": False,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app.main import create_app
+
+            return create_app()
+
+    Server().run()
+
+
+def run_uvicorn(settings: Settings, host: str, port: int, workers: int):
+    # No rolling restarts here: every worker is stopped and started again.
+    uvicorn.run(
+        APP,
+        factory=True,
+        host=host,
+        port=port,
+        workers=workers,
+        loop="auto",
+        http="auto",
+        timeout_keep_alive=settings.server_keepalive,
+        limit_max_requests=settings.server_max_requests or None,
+    )
+
+
+def main():
+    # Not Settings.get(): the workers build their own after the fork.
+    settings = Settings()
+    settings.check_required()
+    parser = argparse.ArgumentParser(description="Run the API server.")
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument("--workers", type=int, default=settings.server_workers)
+    parser.add_argument(
+        "--server",
+        choices=("gunicorn", "uvicorn"),
+        default="gunicorn" if installed("gunicorn") else "uvicorn",
+    )
+    args = parser.parse_args()
+    # Read by the workers, which size their hashing pools by it.
+    environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # uvicorn's "auto" picks these up on its own when they are installed.
+    logger.info(
+        "Starting %s with %d workers, %s event loop, %s HTTP parser",
+        args.server,
+        args.workers,
+        "uvloop" if installed("uvloop") else "asyncio",
+        "httptools" if installed("httptools") else "h11",
+    )
+    if args.server == "gunicorn":
+        run_gunicorn(settings, args.host, args.port, args.workers)
+    else:
+        run_uvicorn(settings, args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
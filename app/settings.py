@@ -1,17 +1,247 @@
+import os
 from functools import lru_cache
-from os import environ
+from os import cpu_count, environ
 from urllib.parse import quote_plus
 
+REQUIRED_SETTINGS = (
+    "JWT_SECRET_KEY",
+    "ALGORITHM",
+    "ACCESS_TOKEN_EXPIRE_MINUTES",
+    "REFRESH_TOKEN_EXPIRE_DAYS",
+)
+
+
+def available_cpus() -> int:
+    # CPUs this process may run on, which a container cpuset can limit.
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return cpu_count() or 1
+
 
 class Settings:
     def __init__(self):
+        self.server_host = environ.get("SERVER_HOST", "0.0.0.0")
+        self.server_port = int(environ.get("SERVER_PORT", 9000))
+        # Worker processes started by app.server.
+        self.server_workers = int(
+            environ.get("WEB_CONCURRENCY", available_cpus())
+        )
+        self.server_graceful_timeout = int(
+            environ.get("SERVER_GRACEFUL_TIMEOUT", 30)
+        )
+        self.server_keepalive = int(environ.get("SERVER_KEEPALIVE", 5))
+        # Recycle a worker after this many requests, 0 to never recycle.
+        self.server_max_requests = int(environ.get("SERVER_MAX_REQUESTS", 0))
+        self.server_max_requests_jitter = int(
+            environ.get("SERVER_MAX_REQUESTS_JITTER", 0)
+        )
+        # JSON serializer of API responses: "orjson" or "json" (stdlib).
+        self.response_class = environ.get("RESPONSE_CLASS", "orjson")
+
         self.host = environ.get("POSTGRES_HOST", None)
         self.port = environ.get("POSTGRES_PORT", None)
         self.database = environ.get("POSTGRES_DB", None)
         self.database_test = environ.get("POSTGRES_DB_TEST", None)
         self.user = environ.get("POSTGRES_USER", None)
         self.password = quote_plus(environ.get("POSTGRES_PASSWORD", ""))
+        # Optional streaming replica for read-only queries; unset means
+        # every query goes to the primary above.
+        self.replica_host = environ.get("POSTGRES_REPLICA_HOST", None)
+        self.replica_port = environ.get("POSTGRES_REPLICA_PORT", self.port)
+        self.replica_database = environ.get(
+            "POSTGRES_REPLICA_DB", self.database
+        )
+        self.database_test_replica = environ.get(
+            "POSTGRES_DB_TEST_REPLICA", self.database_test
+        )
+        # Reads of a user written less than this many seconds ago go to
+        # the primary, so nobody sees the replica lag behind their write.
+        self.db_replica_pin_window = float(
+            environ.get("DB_REPLICA_PIN_WINDOW", 5)
+        )
+        self.db_replica_pin_size = int(
+            environ.get("DB_REPLICA_PIN_SIZE", 100000)
+        )
+        self.db_pool_size = int(environ.get("DB_POOL_SIZE", 5))
+        self.db_max_overflow = int(environ.get("DB_MAX_OVERFLOW", 10))
+        self.db_pool_timeout = float(environ.get("DB_POOL_TIMEOUT", 30))
+        self.db_pool_recycle = int(environ.get("DB_POOL_RECYCLE", 1800))
+        self.db_pool_pre_ping = (
+            environ.get("DB_POOL_PRE_PING", "false").lower() == "true"
+        )
+        self.db_statement_cache_size = int(
+            environ.get("DB_STATEMENT_CACHE_SIZE", 100)
+        )
+        # Connections opened before the worker starts accepting requests.
+        self.db_pool_prewarm = min(
+            int(environ.get("DB_POOL_PREWARM", self.db_pool_size)),
+            self.db_pool_size,
+        )
         self.redis_host = environ.get("REDIS_URL", None)
+        self.redis_max_connections = int(
+            environ.get("REDIS_MAX_CONNECTIONS", 50)
+        )
+        self.redis_pool_timeout = float(environ.get("REDIS_POOL_TIMEOUT", 5))
+        self.redis_socket_timeout = float(
+            environ.get("REDIS_SOCKET_TIMEOUT", 5)
+        )
+        self.redis_socket_connect_timeout = float(
+            environ.get("REDIS_SOCKET_CONNECT_TIMEOUT", 2)
+        )
+        self.redis_health_check_interval = int(
+            environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30)
+        )
+
+        self.user_cache_local_size = int(
+            environ.get("USER_CACHE_LOCAL_SIZE", 10000)
+        )
+        self.user_cache_local_ttl = float(
+            environ.get("USER_CACHE_LOCAL_TTL", 5)
+        )
+        self.user_cache_codec = environ.get("USER_CACHE_CODEC", "json")
+        self.user_cache_prefix = environ.get("USER_CACHE_PREFIX", "sidus:user")
+        self.user_cache_key_version = environ.get(
+            "USER_CACHE_KEY_VERSION", "v1"
+        )
+        self.user_cache_ttl = float(environ.get("USER_CACHE_TTL", 3600))
+        self.user_cache_ttl_jitter = float(
+            environ.get("USER_CACHE_TTL_JITTER", 0.1)
+        )
+        self.user_cache_negative_ttl = float(
+            environ.get("USER_CACHE_NEGATIVE_TTL", 30)
+        )
+        self.user_cache_lock = (
+            environ.get("USER_CACHE_LOCK", "false").lower() == "true"
+        )
+        self.user_cache_lock_ttl = int(
+            environ.get("USER_CACHE_LOCK_TTL_MS", 2000)
+        )
+        self.user_cache_lock_wait = float(
+            environ.get("USER_CACHE_LOCK_WAIT", 0.2)
+        )
+        self.users_batch_max_ids = int(environ.get("USERS_BATCH_MAX_IDS", 100))
+        # Matches a search can page through in total, however broad.
+        self.users_search_max_results = int(
+            environ.get("USERS_SEARCH_MAX_RESULTS", 1000)
+        )
+        self.users_export_batch_size = int(
+            environ.get("USERS_EXPORT_BATCH_SIZE", 5000)
+        )
+        # Imports running at once; further ones get 503 right away.
+        self.users_import_concurrency = int(
+            environ.get("USERS_IMPORT_CONCURRENCY", 1)
+        )
+        # Three bind parameters per row; asyncpg allows at most 32767.
+        self.users_import_batch_size = min(
+            int(environ.get("USERS_IMPORT_BATCH_SIZE", 1000)), 10000
+        )
+
+        # Required, see REQUIRED_SETTINGS.
+        self.jwt_secret_key = environ.get("JWT_SECRET_KEY", None)
+        self.algorithm = environ.get("ALGORITHM", None)
+        self.access_token_expire_minutes = int(
+            environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 0)
+        )
+        self.refresh_token_expire_days = int(
+            environ.get("REFRESH_TOKEN_EXPIRE_DAYS", 0)
+        )
+        self.missing_settings = [
+            name for name in REQUIRED_SETTINGS if not environ.get(name)
+        ]
+        self.refresh_token_prefix = environ.get(
+            "REFRESH_TOKEN_PREFIX", "sidus:auth"
+        )
+        # Users allowed to call /ops/* and the bulk user export and import.
+        self.admin_user_ids = {
+            int(user_id)
+            for user_id in environ.get("ADMIN_USER_IDS", "").split(",")
+            if user_id.strip()
+        }
+        # Entries, not bytes: a decoded payload takes about 0.6 KB, so the
+        # default bounds the cache at roughly 6 MB per worker.
+        self.token_cache_size = int(environ.get("TOKEN_CACHE_SIZE", 10000))
+
+        self.password_hash_executor = environ.get(
+            "PASSWORD_HASH_EXECUTOR", "thread"
+        )
+        # Every server worker has its own hashing pool. Under app.server,
+        # which sets WEB_CONCURRENCY, they share the CPUs between them; a
+        # single process started another way gets them all.
+        hash_workers = available_cpus()
+        if "WEB_CONCURRENCY" in environ:
+            hash_workers = max(1, hash_workers // self.server_workers)
+        self.password_hash_workers = int(
+            environ.get("PASSWORD_HASH_WORKERS", hash_workers)
+        )
+        self.password_hash_queue_size = int(
+            environ.get("PASSWORD_HASH_QUEUE_SIZE", 64)
+        )
+        # Hashing chunks bulk imports may have in the pool at once. Login
+        # and register wait behind at most this many chunks, so with a
+        # single hashing worker they still get every other turn.
+        self.password_hash_bulk_workers = int(
+            environ.get(
+                "PASSWORD_HASH_BULK_WORKERS",
+                max(1, self.password_hash_workers // 2),
+            )
+        )
+        # New hashes use the first scheme; hashes of other schemes or with
+        # other costs are replaced on the next successful login.
+        self.password_schemes = [
+            scheme.strip()
+            for scheme in environ.get("PASSWORD_SCHEMES", "bcrypt").split(",")
+            if scheme.strip()
+        ]
+        self.password_bcrypt_rounds = int(
+            environ.get("PASSWORD_BCRYPT_ROUNDS", 12)
+        )
+        self.password_argon2_time_cost = int(
+            environ.get("PASSWORD_ARGON2_TIME_COST", 3)
+        )
+        self.password_argon2_memory_cost = int(
+            environ.get("PASSWORD_ARGON2_MEMORY_COST", 65536)
+        )
+        self.password_argon2_parallelism = int(
+            environ.get("PASSWORD_ARGON2_PARALLELISM", 1)
+        )
+
+        # Admission control shared by the password hashing auth routes.
+        self.auth_admission_concurrency = int(
+            environ.get(
+                "AUTH_ADMISSION_CONCURRENCY", self.password_hash_workers
+            )
+        )
+        self.auth_admission_queue_size = int(
+            environ.get(
+                "AUTH_ADMISSION_QUEUE_SIZE",
+                self.auth_admission_concurrency * 4,
+            )
+        )
+        self.auth_admission_timeout = float(
+            environ.get("AUTH_ADMISSION_TIMEOUT", 2)
+        )
+        self.auth_admission_retry_after = int(
+            environ.get("AUTH_ADMISSION_RETRY_AFTER", 1)
+        )
+
+        self.rate_limit_enabled = (
+            environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+        )
+        self.rate_limit_prefix = environ.get(
+            "RATE_LIMIT_PREFIX", "sidus:ratelimit"
+        )
+        # "<requests>/<seconds>" per route and key, empty to disable.
+        self.rate_limits = {
+            "login": {
+                "phone": environ.get("RATE_LIMIT_LOGIN_PHONE", "5/60"),
+                "ip": environ.get("RATE_LIMIT_LOGIN_IP", "30/60"),
+            },
+            "register": {
+                "phone": environ.get("RATE_LIMIT_REGISTER_PHONE", "5/60"),
+                "ip": environ.get("RATE_LIMIT_REGISTER_IP", "10/60"),
+            },
+        }
 
         self.async_driver = "asyncpg"
 
@@ -24,15 +254,36 @@ class Settings:
             f"postgresql+{self.async_driver}://{self.user}:"
             f"{self.password}@{self.host}:{self.port}/{self.database}"
         )
+        self.replica_async_connection_url = (
+            f"postgresql+{self.async_driver}://{self.user}:"
+            f"{self.password}@{self.replica_host}:{self.replica_port}/"
+            f"{self.replica_database}"
+            if self.replica_host
+            else None
+        )
         self.test_async_connection_url = (
             f"postgresql+{self.async_driver}://{self.user}:"
             f"{self.password}@{self.host}:{self.port}/{self.database_test}"
         )
+        self.test_replica_async_connection_url = (
+            f"postgresql+{self.async_driver}://{self.user}:"
+            f"{self.password}@{self.host}:{self.port}/"
+            f"{self.database_test_replica}"
+        )
         self.test_sync_connection_url = (
             f"postgresql://{self.user}:{self.password}"
             f"@{self.host}:{self.port}/{self.database_test}"
         )
 
+    def check_required(self):
+        # Without them every token operation fails; refuse to start
+        # instead of answering 500 to every login.
+        if self.missing_settings:
+            raise RuntimeError(
+                "Missing required settings: "
+                + ", ".join(self.missing_settings)
+            )
+
     @classmethod
     @lru_cache()
     def get(cls):
@@ -1,3 +1,6 @@
+import datetime
+from unittest.mock import patch
+
 import pytest
 from httpx import AsyncClient
 from sqlalchemy import create_engine
@@ -5,7 +8,11 @@ from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy_utils import create_database, database_exists, drop_database
 
-from app.database.deps import Base, get_async_session
+from app.database.deps import (
+    Base,
+    get_async_read_session,
+    get_async_session,
+)
 from app.settings import Settings
 
 settings = Settings.get()
@@ -40,6 +47,22 @@ async def session(async_engine) -> AsyncSession:
         yield session
 
 
+@pytest.fixture(scope="function")
+async def replica_session(session) -> AsyncSession:
+    # POSTGRES_DB_TEST_REPLICA defaults to the test database itself, which
+    # stands in for a replica with no lag.
+    engine = create_async_engine(settings.test_replica_async_connection_url)
+    async_session = sessionmaker(
+        engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+    async with async_session() as replica_session:
+        replica_session.info["primary"] = session
+        yield replica_session
+
+    await engine.dispose()
+
+
 @pytest.fixture(scope="function", autouse=True)
 def create_db(sync_engine):
     url = sync_engine.url
@@ -54,14 +77,31 @@ def create_db(sync_engine):
         drop_database(url)
 
 
+@pytest.fixture(scope="function", autouse=True)
+def clear_local_caches():
+    from app.internal import auth as auth_internal
+    from app.internal import user as user_internal
+
+    user_internal.local_cache.clear()
+    user_internal.recent_writes.clear()
+    auth_internal.token_cache.clear()
+    yield
+
+
 @pytest.fixture(scope="function")
-async def client_factory(session):
-    from app.main import app
+async def client_factory(session, replica_session):
+    from app.main import create_app
+
+    app = create_app()
 
     async def override_get_db():
         yield session
 
+    async def override_get_read_db():
+        yield replica_session
+
     app.dependency_overrides[get_async_session] = override_get_db
+    app.dependency_overrides[get_async_read_session] = override_get_read_db
 
     class ClientFactory:
         @staticmethod
@@ -74,8 +114,6 @@ async def client_factory(session):
 
     yield ClientFactory
 
-    app.dependency_overrides[get_async_session] = get_async_session
-
 
 @pytest.fixture(scope="function")
 async def client(client_factory):
@@ -83,3 +121,22 @@ async def client(client_factory):
 
     async with client:
         yield client
+
+
+@pytest.fixture(scope="function")
+async def admin_headers(session):
+    from app.internal import auth as auth_internal
+    from app.schemas.auth import PostUserScheme
+
+    user = await auth_internal.register(
+        session,
+        PostUserScheme(
+            name="Admin", phone="+71111111111", password="adminpassword"
+        ),
+    )
+    token = await auth_internal._create_token(
+        {"sub": str(user.id), "purpose": auth_internal.ACCESS_PURPOSE},
+        datetime.timedelta(minutes=5),
+    )
+    with patch.object(auth_internal.settings, "admin_user_ids", {user.id}):
+        yield {"Authorization": f"Bearer {token}"}
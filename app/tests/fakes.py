@@ -0,0 +1,79 @@
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.published = []
+
+    async def set(self, key, data, ex=None, px=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = data
+        self.ttls[key] = px if ex is None else ex * 1000
+        return True
+
+    async def get(self, key):
+        return self.data.get(key, None)
+
+    async def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    async def mget(self, keys):
+        return [self.data.get(key, None) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        return FakeSlidingWindowScript(self)
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def set(self, key, data, ex=None, px=None):
+        self.commands.append((self.redis.set, (key, data), {"px": px}))
+        return self
+
+    def delete(self, key):
+        self.commands.append((self.redis.delete, (key,), {}))
+        return self
+
+    def publish(self, channel, message):
+        self.commands.append((self.redis.publish, (channel, message), {}))
+        return self
+
+    async def execute(self):
+        results = [
+            await command(*args, **kwargs)
+            for command, args, kwargs in self.commands
+        ]
+        self.commands = []
+        return results
+
+
+class FakeSlidingWindowScript:
+    # Python version of ratelimit.SLIDING_WINDOW_SCRIPT, the only script
+    # registered through register_script.
+    def __init__(self, redis):
+        self.redis = redis
+
+    async def __call__(self, keys=(), args=(), client=None):
+        redis = client or self.redis
+        now, _, *limits = args
+        retry_after = 0
+        for index, key in enumerate(keys):
+            requests, window = limits[index * 2], limits[index * 2 + 1]
+            window_log = redis.data.setdefault(key, [])
+            window_log[:] = [ts for ts in window_log if ts > now - window]
+            if len(window_log) >= requests:
+                retry_after = max(retry_after, window_log[0] + window - now)
+        if retry_after:
+            return retry_after
+        for key in keys:
+            redis.data[key].append(now)
+        return 0
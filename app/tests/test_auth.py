@@ -1,14 +1,33 @@
+import asyncio
+import datetime
+import time
+from unittest.mock import patch
+
 import pytest
+from fastapi import HTTPException
+from jose import jwt
 from sqlalchemy import select
 from starlette.status import (
     HTTP_200_OK,
     HTTP_403_FORBIDDEN,
     HTTP_422_UNPROCESSABLE_ENTITY,
+    HTTP_429_TOO_MANY_REQUESTS,
+    HTTP_503_SERVICE_UNAVAILABLE,
 )
 
 from app.database.models.user import User
-from app.internal.auth import _create_tokens, register
+from app.internal import auth as auth_internal
+from app.internal import hashing
+from app.internal.admission import AdmissionController
+from app.internal.auth import (
+    _create_tokens,
+    _decode_token,
+    register,
+    token_cache,
+)
+from app.internal.ratelimit import Limit, RateLimiter, rate_limiter
 from app.schemas.auth import PostUserScheme
+from app.tests.fakes import FakeRedis
 
 TEST_USER = {
     "name": "Alice",
@@ -49,13 +68,22 @@ class TestAuth:
         )
         assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
 
-    async def test_login(self, client, session):
-        await register(session, PostUserScheme(**TEST_USER2))
+    @patch("app.internal.deps.get_async_redis")
+    async def test_login(self, mock_get_redis, client, session):
+        redis = FakeRedis()
+        mock_get_redis.return_value = redis
+        user = await register(session, PostUserScheme(**TEST_USER2))
         response = await client.post(
             "/api/v1/auth/login",
             json={"login": "+79239999990", "password": "notAlicePassword"},
         )
         assert response.status_code == HTTP_200_OK
+        jti = _decode_token(response.json()["refresh_token"])["jti"]
+        settings = auth_internal.settings
+        key = f"{settings.refresh_token_prefix}:refresh:{user.id}:{jti}"
+        assert key in redis.data
+        lifetime = settings.refresh_token_expire_days * 24 * 60 * 60
+        assert redis.ttls[key] == lifetime * 1000
 
     async def test_login_incorrect(self, client, session):
         await register(session, PostUserScheme(**TEST_USER2))
@@ -65,6 +93,108 @@ class TestAuth:
         )
         assert response.status_code == HTTP_403_FORBIDDEN
 
+    @patch("app.internal.deps.get_async_redis")
+    async def test_login_rehashes_password(
+        self, mock_get_redis, client, session
+    ):
+        mock_get_redis.return_value = FakeRedis()
+        with patch.object(hashing.settings, "password_bcrypt_rounds", 4):
+            with patch.object(
+                hashing,
+                "_pwd_context",
+                hashing.build_context(hashing.settings),
+            ):
+                user = await register(session, PostUserScheme(**TEST_USER2))
+        with patch.object(hashing.settings, "password_bcrypt_rounds", 5):
+            with patch.object(
+                hashing,
+                "_pwd_context",
+                hashing.build_context(hashing.settings),
+            ):
+                for _ in range(2):
+                    response = await client.post(
+                        "/api/v1/auth/login",
+                        json={
+                            "login": TEST_USER2["phone"],
+                            "password": TEST_USER2["password"],
+                        },
+                    )
+                    assert response.status_code == HTTP_200_OK
+
+        user_db = await session.get(User, user.id)
+        await session.refresh(user_db)
+        assert user_db.password.startswith(b"$2b$05$")
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_login_rate_limited(self, mock_get_redis, client, session):
+        mock_get_redis.return_value = FakeRedis()
+        await register(session, PostUserScheme(**TEST_USER2))
+        rules = {"login": {"phone": Limit(2, 60), "ip": None}}
+        with patch.object(rate_limiter, "rules", rules), patch(
+            "app.internal.hashing.verify_and_update",
+            wraps=hashing.verify_and_update,
+        ) as verify:
+            for expected_status in [
+                HTTP_403_FORBIDDEN,
+                HTTP_403_FORBIDDEN,
+                HTTP_429_TOO_MANY_REQUESTS,
+            ]:
+                response = await client.post(
+                    "/api/v1/auth/login",
+                    json={"login": "+79239999990", "password": "wrong"},
+                )
+                assert response.status_code == expected_status
+            assert verify.call_count == 2
+        assert 0 < int(response.headers["Retry-After"]) <= 60
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_login_token_store_unavailable(
+        self, mock_get_redis, client, session
+    ):
+        mock_get_redis.side_effect = OSError("Connection refused")
+        await register(session, PostUserScheme(**TEST_USER2))
+        response = await client.post(
+            "/api/v1/auth/login",
+            json={
+                "login": TEST_USER2["phone"],
+                "password": TEST_USER2["password"],
+            },
+        )
+        assert response.status_code == HTTP_503_SERVICE_UNAVAILABLE
+        assert "Retry-After" in response.headers
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_rate_limit_script_registered_once(self, mock_get_redis):
+        # Like get_async_redis, every call returns a new client.
+        data = {}
+
+        def new_client():
+            redis = FakeRedis()
+            redis.data = data
+            return redis
+
+        mock_get_redis.side_effect = new_client
+        limiter = RateLimiter("test", {"login": {"ip": "2/60"}})
+        with patch.object(
+            FakeRedis,
+            "register_script",
+            autospec=True,
+            side_effect=FakeRedis.register_script,
+        ) as register_script:
+            for _ in range(2):
+                await limiter.check("login", ip="1.2.3.4")
+            with pytest.raises(HTTPException) as error:
+                await limiter.check("login", ip="1.2.3.4")
+        assert error.value.status_code == HTTP_429_TOO_MANY_REQUESTS
+        assert register_script.call_count == 1
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_rate_limit_fails_open(self, mock_get_redis):
+        mock_get_redis.side_effect = OSError("Connection refused")
+        errors = rate_limiter.stats.errors
+        await rate_limiter.check("login", phone="+79239999990", ip="1.2.3.4")
+        assert rate_limiter.stats.errors == errors + 1
+
     async def test_login_empty(self, client):
         response = await client.post(
             "/api/v1/auth/login",
@@ -73,7 +203,9 @@ class TestAuth:
 
         assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
 
-    async def test_refresh(self, client, session):
+    @patch("app.internal.deps.get_async_redis")
+    async def test_refresh(self, mock_get_redis, client, session):
+        mock_get_redis.return_value = FakeRedis()
         await register(session, PostUserScheme(**TEST_USER2))
         user_db = (await session.execute(select(User))).scalars().all()[0]
         tokens = await _create_tokens(user_db)
@@ -85,9 +217,71 @@ class TestAuth:
         received_data = response.json()
         assert list(received_data) == ["access_token", "refresh_token"]
         await session.refresh(user_db)
-        assert received_data["refresh_token"] == user_db.refresh_token
+        assert user_db.refresh_token is None
 
-    async def test_refresh_wrong(self, client, session):
+        # The used token was rotated out, the new one is valid once.
+        response = await client.post(
+            "/api/v1/auth/refresh",
+            headers={"Authorization": f"Bearer {tokens['refresh']}"},
+        )
+        assert response.status_code == HTTP_403_FORBIDDEN
+        response = await client.post(
+            "/api/v1/auth/refresh",
+            headers={
+                "Authorization": f"Bearer {received_data['refresh_token']}"
+            },
+        )
+        assert response.status_code == HTTP_200_OK
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_refresh_legacy_token(self, mock_get_redis, client, session):
+        mock_get_redis.return_value = FakeRedis()
+        user = await register(session, PostUserScheme(**TEST_USER2))
+        # Refresh tokens issued before the token store carry no jti.
+        token = await auth_internal._create_token(
+            {"sub": str(user.id), "purpose": auth_internal.REFRESH_PURPOSE},
+            datetime.timedelta(days=1),
+        )
+        response = await client.post(
+            "/api/v1/auth/refresh",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == HTTP_200_OK
+        assert "jti" in _decode_token(response.json()["refresh_token"])
+
+        response = await client.post(
+            "/api/v1/auth/refresh",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == HTTP_403_FORBIDDEN
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_refresh_multiple_devices(
+        self, mock_get_redis, client, session
+    ):
+        mock_get_redis.return_value = FakeRedis()
+        await register(session, PostUserScheme(**TEST_USER2))
+        refresh_tokens = []
+        for _ in range(2):
+            response = await client.post(
+                "/api/v1/auth/login",
+                json={
+                    "login": TEST_USER2["phone"],
+                    "password": TEST_USER2["password"],
+                },
+            )
+            refresh_tokens.append(response.json()["refresh_token"])
+
+        for token in refresh_tokens:
+            response = await client.post(
+                "/api/v1/auth/refresh",
+                headers={"Authorization": f"Bearer {token}"},
+            )
+            assert response.status_code == HTTP_200_OK
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_refresh_wrong(self, mock_get_redis, client, session):
+        mock_get_redis.return_value = FakeRedis()
         await register(session, PostUserScheme(**TEST_USER2))
         user_db = (await session.execute(select(User))).scalars().all()[0]
         tokens = await _create_tokens(user_db)
@@ -98,3 +292,99 @@ class TestAuth:
         assert response.status_code == HTTP_403_FORBIDDEN
         received_data = response.json()
         assert list(received_data) == ["detail"]
+
+    async def test_password_hashing_overloaded(self):
+        with patch.object(hashing.settings, "password_hash_queue_size", 0):
+            with pytest.raises(HTTPException) as error:
+                await hashing.hash_password(TEST_USER["password"])
+        assert error.value.status_code == HTTP_503_SERVICE_UNAVAILABLE
+
+    async def test_hash_passwords_chunks(self):
+        pending = []
+
+        def hash_many(passwords):
+            pending.append(hashing.stats.pending)
+            now = time.perf_counter()
+            return [password.upper() for password in passwords], now, now
+
+        passwords = [f"password{i}" for i in range(10)]
+        with patch.object(hashing, "_hash_many", hash_many), patch.object(
+            hashing.settings, "password_hash_bulk_workers", 2
+        ):
+            hashed = await hashing.hash_passwords(passwords)
+            assert hashed == [password.upper() for password in passwords]
+            assert len(pending) == 3
+            assert max(pending) <= 2
+
+            # Bulk chunks wait for the pool instead of failing the import.
+            rejected = hashing.stats.rejected
+            with patch.object(hashing.settings, "password_hash_queue_size", 0):
+                hashed = await hashing.hash_passwords(passwords)
+            assert hashed == [password.upper() for password in passwords]
+            assert hashing.stats.rejected == rejected
+
+    async def test_password_hashing(self):
+        hashed = await hashing.hash_password(TEST_USER["password"])
+        assert await hashing.verify_password(TEST_USER["password"], hashed)
+        assert not await hashing.verify_password("wrong", hashed)
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_token_cache(self, mock_get_redis, session):
+        mock_get_redis.return_value = FakeRedis()
+        await register(session, PostUserScheme(**TEST_USER2))
+        user_db = (await session.execute(select(User))).scalars().all()[0]
+        tokens = await _create_tokens(user_db)
+
+        with patch("app.internal.auth.jwt.decode", wraps=jwt.decode) as decode:
+            payload = _decode_token(tokens["access"])
+            assert _decode_token(tokens["access"]) == payload
+            assert decode.call_count == 1
+        assert payload["sub"] == str(user_db.id)
+        assert token_cache.counters.hits >= 1
+
+    async def test_admission_queue_full(self):
+        controller = AdmissionController(
+            concurrency=1, queue_size=1, timeout=5, retry_after=3
+        )
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot():
+                await release.wait()
+
+        running = [asyncio.ensure_future(hold()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert controller.as_dict()["in_flight"] == 1
+        assert controller.as_dict()["queued"] == 1
+
+        with pytest.raises(HTTPException) as error:
+            async with controller.slot():
+                pass
+        assert error.value.status_code == HTTP_503_SERVICE_UNAVAILABLE
+        assert error.value.headers["Retry-After"] == "3"
+
+        release.set()
+        await asyncio.gather(*running)
+        stats = controller.as_dict()
+        assert stats["in_flight"] == 0
+        assert stats["admitted"] == 2
+        assert stats["rejected_queue_full"] == 1
+
+    async def test_admission_deadline(self):
+        controller = AdmissionController(
+            concurrency=1, queue_size=1, timeout=0.01, retry_after=1
+        )
+        async with controller.slot():
+            with pytest.raises(HTTPException) as error:
+                async with controller.slot():
+                    pass
+        assert error.value.status_code == HTTP_503_SERVICE_UNAVAILABLE
+        stats = controller.as_dict()
+        assert stats["in_flight"] == 0
+        assert stats["queued"] == 0
+        assert stats["rejected_deadline"] == 1
+
+    async def test_token_cache_rejects_invalid(self):
+        with pytest.raises(HTTPException):
+            _decode_token("not.a.token")
+        assert len(token_cache) == 0
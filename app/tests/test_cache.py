@@ -0,0 +1,72 @@
+import pickle
+import time
+
+import pytest
+
+from app.internal.cache import LocalCache
+from app.internal.codecs import get_codec
+from app.schemas.user import GetUserScheme
+
+USER = GetUserScheme(id=1, name="Alice", phone="+79999999990")
+
+
+class TestLocalCache:
+    def test_lru_eviction(self):
+        cache = LocalCache(max_size=2, ttl=60)
+        cache.set(1, "Alice")
+        cache.set(2, "Bob")
+        assert cache.get(1) == "Alice"
+        cache.set(3, "Carol")
+
+        assert cache.get(2) is None
+        assert cache.get(1) == "Alice"
+        assert cache.get(3) == "Carol"
+        assert cache.counters.evictions == 1
+
+    def test_ttl_expiration(self):
+        cache = LocalCache(max_size=2, ttl=0.01)
+        cache.set(1, "Alice")
+        cache.set(2, "Bob", ttl=60)
+        time.sleep(0.02)
+
+        assert cache.get(1) is None
+        assert cache.get(2) == "Bob"
+        assert len(cache) == 1
+
+    def test_stats(self):
+        cache = LocalCache(max_size=2, ttl=60)
+        cache.set(1, "Alice")
+        cache.get(1)
+        cache.get(2)
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.5
+
+
+class TestCodecs:
+    @pytest.mark.parametrize("codec_name", ["json", "msgpack"])
+    def test_roundtrip(self, codec_name):
+        codec = get_codec(codec_name, GetUserScheme, 1)
+        assert codec.decode(codec.encode(USER)) == USER
+
+    @pytest.mark.parametrize("codec_name", ["json", "msgpack"])
+    def test_stale_payloads_are_misses(self, codec_name):
+        codec = get_codec(codec_name, GetUserScheme, 1)
+        newer_codec = get_codec(codec_name, GetUserScheme, 2)
+
+        assert codec.decode(None) is None
+        assert codec.decode(pickle.dumps(USER)) is None
+        assert codec.decode(newer_codec.encode(USER)) is None
+        assert codec.decode(codec.header + b"garbage") is None
+
+    @pytest.mark.parametrize("codec_name", ["json", "msgpack"])
+    def test_body(self, codec_name):
+        codec = get_codec(codec_name, GetUserScheme, 1)
+        newer_codec = get_codec(codec_name, GetUserScheme, 2)
+
+        body = codec.body(codec.encode(USER))
+        assert GetUserScheme.parse_raw(body) == USER
+        assert codec.body(None) is None
+        assert codec.body(newer_codec.encode(USER)) is None
@@ -0,0 +1,88 @@
+from os import environ
+from unittest.mock import patch
+
+import pytest
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_401_UNAUTHORIZED,
+    HTTP_403_FORBIDDEN,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
+
+from app.internal import user as user_internal
+from app.internal.auth import settings as auth_settings
+from app.settings import Settings
+
+
+class TestOps:
+    pytestmark = pytest.mark.asyncio
+
+    async def test_redis_pool_stats(self, client, admin_headers):
+        response = await client.get("/api/v1/ops/redis", headers=admin_headers)
+        assert response.status_code == HTTP_200_OK
+        received_data = response.json()
+        assert received_data["in_use"] == 0
+        assert received_data["waits"] == 0
+        assert "max_connections" in received_data
+
+    async def test_database_pool_stats(self, client, admin_headers):
+        response = await client.get(
+            "/api/v1/ops/database", headers=admin_headers
+        )
+        assert response.status_code == HTTP_200_OK
+        received_data = response.json()
+        assert received_data["overflow"] >= 0
+        assert "checked_out" in received_data
+        assert "wait_time" in received_data
+
+    async def test_ops_requires_admin(self, client, admin_headers):
+        response = await client.get("/api/v1/ops/cache")
+        assert response.status_code == HTTP_401_UNAUTHORIZED
+
+        with patch.object(auth_settings, "admin_user_ids", set()):
+            response = await client.get(
+                "/api/v1/ops/cache", headers=admin_headers
+            )
+        assert response.status_code == HTTP_403_FORBIDDEN
+
+    async def test_cache_keyspace_max_keys(self, client, admin_headers):
+        response = await client.get(
+            "/api/v1/ops/cache/keyspace",
+            params={"max_keys": user_internal.KEYSPACE_MAX_KEYS + 1},
+            headers=admin_headers,
+        )
+        assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_create_app_requires_settings(self):
+        from app.main import create_app
+
+        with patch.object(
+            auth_settings, "missing_settings", ["JWT_SECRET_KEY"]
+        ):
+            with pytest.raises(RuntimeError, match="JWT_SECRET_KEY"):
+                create_app()
+
+    async def test_password_hash_workers_default(self):
+        with patch.dict(environ), patch(
+            "app.settings.available_cpus", return_value=8
+        ):
+            environ.pop("PASSWORD_HASH_WORKERS", None)
+            environ.pop("WEB_CONCURRENCY", None)
+            assert Settings().password_hash_workers == 8
+            environ["WEB_CONCURRENCY"] = "4"
+            assert Settings().password_hash_workers == 2
+
+    async def test_metrics(self, client, session):
+        await client.get("/api/v1/users")
+        response = await client.get("/metrics")
+        assert response.status_code == HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/plain")
+        assert (
+            'http_request_duration_seconds_count{route="/api/v1/users",'
+            'method="GET",status="200"}' in response.text
+        )
+        assert (
+            'http_request_stage_duration_seconds_count{route="/api/v1/users",'
+            'stage="db"}' in response.text
+        )
+        assert "db_pool_checked_out" in response.text
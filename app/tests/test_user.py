@@ -1,16 +1,27 @@
+import asyncio
+import base64
+import csv
+import json
 from unittest.mock import patch
 
 import pytest
+from sqlalchemy import select
 from starlette.status import (
     HTTP_200_OK,
     HTTP_401_UNAUTHORIZED,
     HTTP_403_FORBIDDEN,
     HTTP_404_NOT_FOUND,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+    HTTP_503_SERVICE_UNAVAILABLE,
 )
 
+from app.database import deps as database_deps
 from app.database.models.user import User
+from app.internal import user as user_internal
+from app.internal.admission import controllers as admission
 from app.internal.auth import _create_tokens, register
 from app.schemas.auth import PostUserScheme
+from app.tests.fakes import FakeRedis
 
 TEST_USER = {
     "name": "Alice",
@@ -24,20 +35,6 @@ TEST_USER2 = {
 }
 
 
-class FakeRedis:
-    def __init__(self):
-        self.data = {}
-
-    async def set(self, key, data):
-        self.data[key] = data
-
-    async def get(self, key):
-        return self.data.get(key, None)
-
-    async def delete(self, key):
-        self.data.pop(key, None)
-
-
 class TestUser:
     pytestmark = pytest.mark.asyncio
 
@@ -53,6 +50,151 @@ class TestUser:
         assert response.status_code == HTTP_200_OK
         assert received_data["name"] == user.name
 
+    @patch("app.internal.deps.get_async_redis")
+    async def test_get_user_by_id_cache_key(
+        self, mock_get_redis, client, session
+    ):
+        redis = FakeRedis()
+        mock_get_redis.return_value = redis
+        user = await register(session, PostUserScheme(**TEST_USER))
+        await client.get(f"/api/v1/users/{user.id}")
+
+        settings = user_internal.settings
+        key = (
+            f"{settings.user_cache_prefix}:"
+            f"{settings.user_cache_key_version}:{user.id}"
+        )
+        assert list(redis.data) == [key]
+        ttl = settings.user_cache_ttl * 1000
+        jitter = ttl * settings.user_cache_ttl_jitter
+        assert ttl - jitter <= redis.ttls[key] <= ttl + jitter
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_get_user_by_id_local_cache(
+        self, mock_get_redis, client, session
+    ):
+        redis = FakeRedis()
+        mock_get_redis.return_value = redis
+        user = await register(session, PostUserScheme(**TEST_USER))
+        await client.get(f"/api/v1/users/{user.id}")
+        redis.data.clear()
+        hits = user_internal.local_cache.counters.hits
+
+        response = await client.get(f"/api/v1/users/{user.id}")
+        assert response.status_code == HTTP_200_OK
+        assert response.json()["name"] == user.name
+        assert user_internal.local_cache.counters.hits == hits + 1
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_get_user_by_id_cached_body(
+        self, mock_get_redis, client, session
+    ):
+        redis = FakeRedis()
+        mock_get_redis.return_value = redis
+        user = await register(session, PostUserScheme(**TEST_USER))
+        await client.get(f"/api/v1/users/{user.id}")
+        user_internal.local_cache.clear()
+
+        with patch.object(user_internal.user_codec, "decode") as decode:
+            response = await client.get(f"/api/v1/users/{user.id}")
+        assert response.status_code == HTTP_200_OK
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == {
+            "id": user.id,
+            "name": user.name,
+            "phone": user.phone,
+        }
+        decode.assert_not_called()
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_get_user_by_id_coalesced(self, mock_get_redis, session):
+        mock_get_redis.return_value = FakeRedis()
+        user = await register(session, PostUserScheme(**TEST_USER))
+        coalesced = user_internal.single_flight.coalesced
+
+        with patch.object(
+            session, "get", wraps=session.get
+        ) as session_get, patch.object(
+            database_deps, "new_session", wraps=database_deps.new_session
+        ) as new_session:
+            results = await asyncio.gather(
+                *(user_internal.get_by_id(session, user.id) for _ in range(5))
+            )
+        assert [result.name for result in results] == [user.name] * 5
+        # One load for all callers, on a session none of them owns.
+        new_session.assert_called_once_with(session)
+        session_get.assert_not_awaited()
+        assert user_internal.single_flight.coalesced == coalesced + 4
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_get_user_by_id_negative_cache(
+        self, mock_get_redis, client, session
+    ):
+        redis = FakeRedis()
+        mock_get_redis.return_value = redis
+        user = await register(session, PostUserScheme(**TEST_USER))
+        missing_id = user.id + 1
+        response = await client.get(f"/api/v1/users/{missing_id}")
+        assert response.status_code == HTTP_404_NOT_FOUND
+        assert (
+            redis.data[user_internal._cache_key(missing_id)]
+            == user_internal.NOT_FOUND_PAYLOAD
+        )
+        negative_hits = user_internal.negative_counters.hits
+
+        with patch.object(
+            database_deps, "new_session", wraps=database_deps.new_session
+        ) as new_session:
+            response = await client.get(f"/api/v1/users/{missing_id}")
+        assert response.status_code == HTTP_404_NOT_FOUND
+        new_session.assert_not_called()
+        assert user_internal.negative_counters.hits == negative_hits + 1
+
+        new_user = await register(session, PostUserScheme(**TEST_USER2))
+        assert new_user.id == missing_id
+        response = await client.get(f"/api/v1/users/{missing_id}")
+        assert response.status_code == HTTP_200_OK
+        assert response.json()["name"] == new_user.name
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_get_user_batch(self, mock_get_redis, client, session):
+        redis = FakeRedis()
+        mock_get_redis.return_value = redis
+        users = [
+            await register(session, PostUserScheme(**user))
+            for user in [TEST_USER, TEST_USER2]
+        ]
+        await client.get(f"/api/v1/users/{users[1].id}")
+        user_internal.local_cache.clear()
+        missing_id = users[1].id + 1
+
+        response = await client.get(
+            "/api/v1/users/batch",
+            params={"ids": [users[1].id, missing_id, users[0].id]},
+        )
+        assert response.status_code == HTTP_200_OK
+        items = response.json()["items"]
+        assert [item["id"] for item in items] == [
+            users[1].id,
+            missing_id,
+            users[0].id,
+        ]
+        assert [item["found"] for item in items] == [True, False, True]
+        assert items[1]["user"] is None
+        assert items[2]["user"]["name"] == users[0].name
+        assert redis.data[user_internal._cache_key(missing_id)] == (
+            user_internal.NOT_FOUND_PAYLOAD
+        )
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_get_user_batch_too_many(
+        self, mock_get_redis, client, session
+    ):
+        mock_get_redis.return_value = FakeRedis()
+        ids = list(range(user_internal.settings.users_batch_max_ids + 1))
+        response = await client.get("/api/v1/users/batch", params={"ids": ids})
+        assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
     @patch("app.internal.deps.get_async_redis")
     async def test_get_user_by_id_404(self, mock_get_redis, client, session):
         mock_get_redis.return_value = FakeRedis()
@@ -69,9 +211,10 @@ class TestUser:
         ]
 
         response = await client.get("/api/v1/users")
-        received_data = response.json()
-
         assert response.status_code == HTTP_200_OK
+        assert response.json()["next_cursor"] is None
+        received_data = response.json()["items"]
+
         assert len(received_data) == 2
         assert "name" in received_data[0]
         assert "id" in received_data[0]
@@ -81,6 +224,279 @@ class TestUser:
         assert "id" in received_data[1]
         assert "phone" in received_data[1]
 
+    async def test_get_user_all_pages(self, client, session):
+        users = [
+            await register(session, PostUserScheme(**user))
+            for user in [TEST_USER, TEST_USER2]
+        ]
+
+        response = await client.get("/api/v1/users", params={"limit": 1})
+        assert response.status_code == HTTP_200_OK
+        first_page = response.json()
+        assert [item["id"] for item in first_page["items"]] == [users[0].id]
+        assert first_page["next_cursor"]
+
+        response = await client.get(
+            "/api/v1/users",
+            params={"limit": 1, "cursor": first_page["next_cursor"]},
+        )
+        second_page = response.json()
+        assert [item["id"] for item in second_page["items"]] == [users[1].id]
+        assert second_page["next_cursor"] is None
+
+        response = await client.get("/api/v1/users", params={"offset": 1})
+        assert [item["id"] for item in response.json()["items"]] == [
+            users[1].id
+        ]
+
+        response = await client.get("/api/v1/users", params={"id__gt": 1})
+        assert [item["id"] for item in response.json()["items"]] == [
+            users[1].id
+        ]
+
+    async def test_get_user_all_invalid_cursor(self, client):
+        response = await client.get("/api/v1/users", params={"cursor": "?"})
+        assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_search_users_prefix(self, client, session):
+        users = [
+            await register(session, PostUserScheme(**user))
+            for user in [TEST_USER, TEST_USER2]
+        ]
+
+        response = await client.get(
+            "/api/v1/users/search", params={"q": "ali"}
+        )
+        assert response.status_code == HTTP_200_OK
+        assert [item["id"] for item in response.json()["items"]] == [
+            users[0].id
+        ]
+
+        # Any fragment of the phone number matches.
+        response = await client.get(
+            "/api/v1/users/search", params={"q": "9999990"}
+        )
+        assert [item["id"] for item in response.json()["items"]] == [
+            user.id for user in users
+        ]
+
+        response = await client.get("/api/v1/users/search", params={"q": "li"})
+        assert response.json()["items"] == []
+
+    async def test_search_users_pages(self, client, session):
+        users = [
+            await register(session, PostUserScheme(**user))
+            for user in [TEST_USER, TEST_USER2]
+        ]
+
+        response = await client.get(
+            "/api/v1/users/search", params={"q": "+79", "limit": 1}
+        )
+        first_page = response.json()
+        assert [item["id"] for item in first_page["items"]] == [users[0].id]
+
+        response = await client.get(
+            "/api/v1/users/search",
+            params={"q": "+79", "cursor": first_page["next_cursor"]},
+        )
+        second_page = response.json()
+        assert [item["id"] for item in second_page["items"]] == [users[1].id]
+        assert second_page["next_cursor"] is None
+
+        response = await client.get(
+            "/api/v1/users/search",
+            params={
+                "q": "+79",
+                "mode": "fuzzy",
+                "cursor": first_page["next_cursor"],
+            },
+        )
+        assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_search_users_max_results(self, client, session):
+        for user in [TEST_USER, TEST_USER2]:
+            await register(session, PostUserScheme(**user))
+
+        with patch.object(
+            user_internal.settings, "users_search_max_results", 1
+        ):
+            response = await client.get(
+                "/api/v1/users/search", params={"q": "+79"}
+            )
+        assert len(response.json()["items"]) == 1
+        assert response.json()["next_cursor"] is None
+
+    async def test_search_users_tampered_cursor(self, client, session):
+        for user in [TEST_USER, TEST_USER2]:
+            await register(session, PostUserScheme(**user))
+
+        response = await client.get(
+            "/api/v1/users/search", params={"q": "+79", "limit": 1}
+        )
+        cursor = response.json()["next_cursor"]
+        value, _, signature = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().rpartition(":")
+        )
+        # Resetting the returned count must not lift the results cap.
+        mode, _, user_id, score = value.split(":")
+        value = f"{mode}:0:{user_id}:{score}:{signature}"
+        response = await client.get(
+            "/api/v1/users/search",
+            params={
+                "q": "+79",
+                "cursor": base64.urlsafe_b64encode(value.encode()).decode(),
+            },
+        )
+        assert response.status_code == HTTP_422_UNPROCESSABLE_ENTITY
+
+    async def test_search_users_fuzzy(self, client, session):
+        users = [
+            await register(session, PostUserScheme(**user))
+            for user in [TEST_USER, TEST_USER2]
+        ]
+
+        response = await client.get(
+            "/api/v1/users/search", params={"q": "Alise", "mode": "fuzzy"}
+        )
+        assert response.status_code == HTTP_200_OK
+        assert [item["id"] for item in response.json()["items"]] == [
+            users[0].id
+        ]
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_export_users(
+        self, mock_get_redis, client, session, admin_headers
+    ):
+        mock_get_redis.return_value = FakeRedis()
+        users = [
+            await register(session, PostUserScheme(**user))
+            for user in [TEST_USER, TEST_USER2]
+        ]
+        # The admin_headers user was registered first.
+        admin = (
+            await session.execute(select(User).order_by(User.id))
+        ).scalar()
+        expected = [
+            {"id": user.id, "name": user.name, "phone": user.phone}
+            for user in [admin, *users]
+        ]
+
+        with patch.object(
+            user_internal.settings, "users_export_batch_size", 1
+        ):
+            response = await client.get(
+                "/api/v1/users/export", headers=admin_headers
+            )
+        assert response.status_code == HTTP_200_OK
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert [
+            json.loads(line) for line in response.text.splitlines()
+        ] == expected
+
+        response = await client.get(
+            "/api/v1/users/export",
+            params={"format": "csv"},
+            headers=admin_headers,
+        )
+        assert response.status_code == HTTP_200_OK
+        assert response.headers["content-type"].startswith("text/csv")
+        rows = list(csv.DictReader(response.text.splitlines()))
+        assert [{**row, "id": int(row["id"])} for row in rows] == expected
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_export_users_unauthorized(
+        self, mock_get_redis, client, session
+    ):
+        mock_get_redis.return_value = FakeRedis()
+        response = await client.get("/api/v1/users/export")
+        assert response.status_code == HTTP_401_UNAUTHORIZED
+
+        user = await register(session, PostUserScheme(**TEST_USER))
+        tokens = await _create_tokens(user)
+        response = await client.get(
+            "/api/v1/users/export",
+            headers={"Authorization": f"Bearer {tokens['access']}"},
+        )
+        assert response.status_code == HTTP_403_FORBIDDEN
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_import_users(
+        self, mock_get_redis, client, session, admin_headers
+    ):
+        redis = FakeRedis()
+        mock_get_redis.return_value = redis
+        await register(session, PostUserScheme(**TEST_USER))
+        new_users = [
+            {"name": f"User {i}", "phone": f"+7000000000{i}", "password": "x"}
+            for i in range(3)
+        ]
+        lines = [
+            json.dumps(new_users[0]),
+            json.dumps(TEST_USER),
+            "",
+            "{broken",
+            json.dumps(new_users[1]),
+            json.dumps({**new_users[2], "phone": new_users[1]["phone"]}),
+            json.dumps(new_users[2]),
+        ]
+
+        with patch.object(
+            user_internal.settings, "users_import_batch_size", 2
+        ):
+            response = await client.post(
+                "/api/v1/users/import",
+                content="\n".join(lines).encode(),
+                headers={
+                    **admin_headers,
+                    "Content-Type": "application/x-ndjson",
+                },
+            )
+        assert response.status_code == HTTP_200_OK
+        summary = response.json()
+        assert summary["received"] == 6
+        assert summary["created"] == 3
+        assert [
+            (failure["line"], failure["phone"])
+            for failure in summary["failed"]
+        ] == [(2, TEST_USER["phone"]), (4, None), (6, new_users[1]["phone"])]
+        # One invalidation for the registered user, one per imported user.
+        assert len(redis.published) == 4
+
+        response = await client.post(
+            "/api/v1/auth/login",
+            json={"login": new_users[2]["phone"], "password": "x"},
+        )
+        assert response.status_code == HTTP_200_OK
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_import_users_unauthorized(
+        self, mock_get_redis, client, session
+    ):
+        mock_get_redis.return_value = FakeRedis()
+        response = await client.post("/api/v1/users/import", content=b"")
+        assert response.status_code == HTTP_401_UNAUTHORIZED
+
+        user = await register(session, PostUserScheme(**TEST_USER))
+        tokens = await _create_tokens(user)
+        response = await client.post(
+            "/api/v1/users/import",
+            content=b"",
+            headers={"Authorization": f"Bearer {tokens['access']}"},
+        )
+        assert response.status_code == HTTP_403_FORBIDDEN
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_import_users_one_at_a_time(
+        self, mock_get_redis, client, admin_headers
+    ):
+        mock_get_redis.return_value = FakeRedis()
+        async with admission["import"].slot():
+            response = await client.post(
+                "/api/v1/users/import", content=b"", headers=admin_headers
+            )
+        assert response.status_code == HTTP_503_SERVICE_UNAVAILABLE
+        assert "Retry-After" in response.headers
+
     @patch("app.internal.deps.get_async_redis")
     async def test_put_user_by_id(self, mock_get_redis, client, session):
         mock_get_redis.return_value = FakeRedis()
@@ -96,6 +512,78 @@ class TestUser:
         received_data = response.json()
         assert received_data["phone"] == "89999999990"
         assert received_data["name"] == "Alex"
+        assert mock_get_redis.return_value.published[-1] == (
+            user_internal.USER_INVALIDATION_CHANNEL,
+            str(user.id),
+        )
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_get_user_by_id_replica(
+        self, mock_get_redis, client, session, replica_session
+    ):
+        mock_get_redis.return_value = FakeRedis()
+        user = await register(session, PostUserScheme(**TEST_USER))
+        user_internal.recent_writes.clear()
+        with patch.object(
+            database_deps, "new_session", wraps=database_deps.new_session
+        ) as new_session:
+            response = await client.get(f"/api/v1/users/{user.id}")
+        assert response.status_code == HTTP_200_OK
+        new_session.assert_called_once_with(replica_session)
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_get_user_by_id_after_write(
+        self, mock_get_redis, client, session, replica_session
+    ):
+        mock_get_redis.return_value = FakeRedis()
+        user = await register(session, PostUserScheme(**TEST_USER))
+        user_db = await session.get(User, user.id)
+        tokens = await _create_tokens(user_db)
+        await client.put(
+            f"/api/v1/users/{user.id}",
+            json={"name": "Alex"},
+            headers={"Authorization": f"Bearer {tokens['access']}"},
+        )
+        with patch.object(
+            database_deps, "new_session", wraps=database_deps.new_session
+        ) as new_session:
+            response = await client.get(f"/api/v1/users/{user.id}")
+        assert response.status_code == HTTP_200_OK
+        assert response.json()["name"] == "Alex"
+        new_session.assert_called_once_with(session)
+
+    @patch("app.internal.deps.get_async_redis")
+    async def test_put_user_by_id_single_lookup(
+        self, mock_get_redis, client, session, replica_session
+    ):
+        mock_get_redis.return_value = FakeRedis()
+        user = await register(session, PostUserScheme(**TEST_USER))
+        user_db = await session.get(User, user.id)
+        tokens = await _create_tokens(user_db)
+        with patch.object(
+            session, "get", wraps=session.get
+        ) as primary_get, patch.object(
+            replica_session, "get", wraps=replica_session.get
+        ) as replica_get:
+            response = await client.put(
+                f"/api/v1/users/{user.id}",
+                json={"name": "Alex"},
+                headers={"Authorization": f"Bearer {tokens['access']}"},
+            )
+        assert response.status_code == HTTP_200_OK
+        assert response.json()["name"] == "Alex"
+        # The token is trusted as is; the row is read once, for the write.
+        assert primary_get.await_count == 1
+        replica_get.assert_not_awaited()
+
+        await session.delete(user_db)
+        await session.commit()
+        response = await client.put(
+            f"/api/v1/users/{user.id}",
+            json={"name": "Alex"},
+            headers={"Authorization": f"Bearer {tokens['access']}"},
+        )
+        assert response.status_code == HTTP_403_FORBIDDEN
 
     @patch("app.internal.deps.get_async_redis")
     async def test_put_user_by_id_403(self, mock_get_redis, client, session):
@@ -0,0 +1,61 @@
+"""Per-request cost of access token verification with and without the
+verified-token cache.
+
+Usage: python -m benchmarks.auth [--number 100000] [--tokens 1000]
+Requires the JWT_* settings from .env in the environment.
+"""
+
+import argparse
+import asyncio
+import datetime
+import timeit
+
+from app.internal import auth as auth_internal
+from app.internal.cache import LocalCache
+
+
+def create_tokens(count: int):
+    lifetime = datetime.timedelta(
+        minutes=auth_internal.settings.access_token_expire_minutes
+    )
+
+    async def create():
+        return [
+            await auth_internal._create_token(
+                {"sub": str(i), "purpose": auth_internal.ACCESS_PURPOSE},
+                lifetime,
+            )
+            for i in range(count)
+        ]
+
+    return asyncio.run(create())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100000)
+    parser.add_argument("--tokens", type=int, default=1000)
+    args = parser.parse_args()
+
+    tokens = create_tokens(args.tokens)
+    picks = [tokens[i % len(tokens)] for i in range(args.number)]
+
+    def run():
+        for token in picks:
+            auth_internal._decode_token(token)
+
+    cache_size = auth_internal.token_cache.max_size
+    auth_internal.token_cache = LocalCache(max_size=0, ttl=0)
+    uncached = timeit.timeit(run, number=1)
+    auth_internal.token_cache = LocalCache(max_size=cache_size, ttl=0)
+    cached = timeit.timeit(run, number=1)
+
+    print(f"{'mode':<10}{'us/request':>12}")
+    print(f"{'jwt.decode':<10}{uncached / args.number * 1e6:>12.2f}")
+    print(f"{'cached':<10}{cached / args.number * 1e6:>12.2f}")
+    stats = auth_internal.token_cache.stats()
+    print(f"hit ratio: {stats['hit_ratio']:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Bulk user import compared with calling /auth/register in a loop.
+
+Runs against a live server, e.g. the one started by `docker-compose up`:
+
+    python -m benchmarks.bulk_import --base-url http://localhost:9001 \
+        --users 5000 --concurrency 32 --admin-login +70000000000 \
+        --admin-password secret
+
+The import is admin-only: --admin-login must be the phone of a user
+listed in the server's ADMIN_USER_IDS. Both modes create --users fresh
+accounts. The register loop sends up to
+--concurrency requests at a time; the import sends one NDJSON request.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import httpx
+
+API = "/api/v1"
+PASSWORD = "benchmark-password"
+
+
+def record(run_id: str, mode: int, number: int) -> dict:
+    return {
+        "name": f"Import {number}",
+        "phone": f"+8{run_id}{mode}{number:07d}",
+        "password": PASSWORD,
+    }
+
+
+async def register_loop(
+    client: httpx.AsyncClient, run_id: str, users: int, concurrency: int
+) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def register(number: int):
+        async with semaphore:
+            response = await client.post(
+                f"{API}/auth/register", json=record(run_id, 0, number)
+            )
+        response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(register(number) for number in range(users)))
+    return time.perf_counter() - started
+
+
+async def bulk_import(
+    client: httpx.AsyncClient, run_id: str, users: int, token: str
+) -> float:
+    body = "\n".join(
+        json.dumps(record(run_id, 1, number)) for number in range(users)
+    )
+    started = time.perf_counter()
+    response = await client.post(
+        f"{API}/users/import",
+        content=body.encode(),
+        headers={
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/x-ndjson",
+        },
+    )
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    summary = response.json()
+    if summary["created"] != users:
+        raise RuntimeError(f"Import created {summary['created']} users")
+    return elapsed
+
+
+async def benchmark(args):
+    run_id = str(uuid.uuid4().int)[:4]
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=args.timeout
+    ) as client:
+        response = await client.post(
+            f"{API}/auth/login",
+            json={"login": args.admin_login, "password": args.admin_password},
+        )
+        response.raise_for_status()
+        token = response.json()["access_token"]
+
+        loop_time = await register_loop(
+            client, run_id, args.users, args.concurrency
+        )
+        import_time = await bulk_import(client, run_id, args.users, token)
+
+    print(f"{'mode':<10}{'seconds':>10}{'users/s':>10}")
+    print(f"{'register':<10}{loop_time:>10.2f}{args.users / loop_time:>10.1f}")
+    print(
+        f"{'import':<10}{import_time:>10.2f}"
+        f"{args.users / import_time:>10.1f}"
+    )
+    print(f"speedup: {loop_time / import_time:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--base-url", default="http://localhost:9001")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--admin-login", required=True)
+    parser.add_argument("--admin-password", required=True)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
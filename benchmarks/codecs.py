@@ -0,0 +1,43 @@
+"""Compare cached user payloads: legacy pickle vs. the cache codecs.
+
+Usage: python -m benchmarks.codecs [--number 100000]
+"""
+
+import argparse
+import pickle
+import timeit
+
+from app.internal.codecs import CODECS, msgpack
+from app.schemas.user import GetUserScheme
+
+USER = GetUserScheme(id=1234567, name="Alice Liddell", phone="+79999999990")
+
+
+def measure(name, encode, decode, number):
+    payload = encode(USER)
+    encode_time = timeit.timeit(lambda: encode(USER), number=number)
+    decode_time = timeit.timeit(lambda: decode(payload), number=number)
+    print(
+        f"{name:<10}{len(payload):>8}"
+        f"{encode_time / number * 1e6:>14.2f}"
+        f"{decode_time / number * 1e6:>14.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'codec':<10}{'bytes':>8}{'encode, us':>14}{'decode, us':>14}")
+    measure("pickle", pickle.dumps, pickle.loads, args.number)
+    for name, codec_class in CODECS.items():
+        if name == "msgpack" and msgpack is None:
+            print(f"{name:<10}not installed")
+            continue
+        codec = codec_class(GetUserScheme, 1)
+        measure(name, codec.encode, codec.decode, args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Throughput and memory use of the streaming users export.
+
+Usage: python -m benchmarks.export [--rows 2000000] [--format ndjson]
+    [--batch-size 5000]
+
+Runs the export generator directly against the database from .env, so
+the numbers exclude HTTP overhead. Missing benchmark rows (phones starting
+with +0) are inserted first with a single INSERT ... SELECT over
+generate_series. The peak is Python heap allocation during the export as
+reported by tracemalloc, which should not grow with --rows.
+"""
+
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from sqlalchemy import text
+
+from app.database.deps import async_read_session, dispose_engine, get_engine
+from app.internal import user as user_internal
+
+SEED_QUERY = text("""
+    INSERT INTO users (name, phone, password)
+    SELECT 'Export ' || i, '+0' || lpad(i::text, 10, '0'), '\\x00'::bytea
+    FROM generate_series(:start, :stop) AS i
+    """)
+COUNT_QUERY = text("SELECT count(*) FROM users WHERE phone LIKE '+0%'")
+
+
+async def seed(rows: int):
+    async with get_engine().begin() as connection:
+        existing = (await connection.execute(COUNT_QUERY)).scalar()
+        if existing < rows:
+            started = time.perf_counter()
+            await connection.execute(
+                SEED_QUERY, {"start": existing + 1, "stop": rows}
+            )
+            print(
+                f"seeded {rows - existing} rows in "
+                f"{time.perf_counter() - started:.1f} s"
+            )
+
+
+async def export(export_format: str):
+    rows = 0
+    size = 0
+    async with async_read_session() as session:
+        tracemalloc.start()
+        started = time.perf_counter()
+        async for chunk in user_internal.export_users(session, export_format):
+            size += len(chunk)
+            rows += chunk.count(b"\n")
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    if export_format == "csv":
+        rows -= 1
+    return rows, size, elapsed, peak
+
+
+async def benchmark(args):
+    await seed(args.rows)
+    rows, size, elapsed, peak = await export(args.format)
+    await dispose_engine()
+
+    print(
+        f"{'rows':>10}{'MB':>10}{'seconds':>10}{'rows/s':>12}{'peak MB':>10}"
+    )
+    print(
+        f"{rows:>10}{size / 2**20:>10.1f}{elapsed:>10.2f}"
+        f"{rows / elapsed:>12.0f}{peak / 2**20:>10.1f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument(
+        "--format",
+        default="ndjson",
+        choices=sorted(user_internal.EXPORT_MEDIA_TYPES),
+    )
+    parser.add_argument("--batch-size", type=int)
+    args = parser.parse_args()
+    if args.batch_size:
+        user_internal.settings.users_export_batch_size = args.batch_size
+    asyncio.run(benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Calibrate password hashing cost to a per-hash latency budget.
+
+Usage: python -m benchmarks.hashing [--target-ms 250] [--workers N]
+
+Run it on the deployment hardware. Each candidate configuration (bcrypt
+rounds, argon2 time cost for a few memory costs) is timed on one core,
+then on --workers processes at once (default: all CPUs). The loaded
+figure is the hashes/s per core the server gets when every hashing worker
+is busy. For each scheme the most expensive configuration that stays
+within --target-ms under load is printed as settings for .env. argon2
+candidates are skipped unless argon2-cffi is installed.
+"""
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from typing import Dict, List, Optional
+
+from passlib.exc import MissingBackendError
+from passlib.hash import argon2, bcrypt
+
+PASSWORD = "calibration-password"
+HANDLERS = {"bcrypt": bcrypt, "argon2": argon2}
+BCRYPT_ROUNDS = range(10, 16)
+ARGON2_TIME_COSTS = range(1, 9)
+ARGON2_MEMORY_COSTS = (19456, 65536)
+
+
+class Candidate:
+    def __init__(self, scheme: str, options: Dict[str, int]):
+        self.scheme = scheme
+        self.options = options
+        self.latency = 0.0
+        self.loaded_latency = 0.0
+
+    @property
+    def label(self) -> str:
+        return ", ".join(
+            f"{key}={value}" for key, value in self.options.items()
+        )
+
+    def settings(self) -> Dict[str, int]:
+        prefix = f"PASSWORD_{self.scheme.upper()}_"
+        return {
+            prefix + key.upper(): value for key, value in self.options.items()
+        }
+
+
+def candidate_groups() -> List[List[Candidate]]:
+    # Within a group every candidate costs more than the previous one.
+    groups = [
+        [Candidate("bcrypt", {"rounds": rounds}) for rounds in BCRYPT_ROUNDS]
+    ]
+    try:
+        argon2.get_backend()
+    except MissingBackendError:
+        print("argon2-cffi is not installed, skipping argon2\n")
+        return groups
+    for memory_cost in ARGON2_MEMORY_COSTS:
+        groups.append(
+            [
+                Candidate(
+                    "argon2",
+                    {
+                        "time_cost": time_cost,
+                        "memory_cost": memory_cost,
+                        "parallelism": 1,
+                    },
+                )
+                for time_cost in ARGON2_TIME_COSTS
+            ]
+        )
+    return groups
+
+
+# Runs in the worker processes, so it takes picklable arguments only.
+def time_hashes(scheme: str, options: Dict[str, int], number: int) -> float:
+    handler = HANDLERS[scheme].using(**options)
+    handler.hash(PASSWORD)
+    started = time.perf_counter()
+    for _ in range(number):
+        handler.hash(PASSWORD)
+    return (time.perf_counter() - started) / number
+
+
+def measure(candidate: Candidate, pool: ProcessPoolExecutor, workers: int):
+    scheme, options = candidate.scheme, candidate.options
+    # At least three hashes and roughly half a second per measurement.
+    number = max(3, int(0.5 / time_hashes(scheme, options, 1)))
+    candidate.latency = time_hashes(scheme, options, number)
+    candidate.loaded_latency = max(
+        pool.map(
+            time_hashes,
+            [scheme] * workers,
+            [options] * workers,
+            [number] * workers,
+        )
+    )
+
+
+def pick(
+    measured: List[Candidate], scheme: str, target: float
+) -> Optional[Candidate]:
+    fitting = [
+        candidate
+        for candidate in measured
+        if candidate.scheme == scheme and candidate.loaded_latency <= target
+    ]
+    return max(fitting, key=lambda c: c.loaded_latency, default=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1)
+    args = parser.parse_args()
+    target = args.target_ms / 1000
+
+    print(
+        f"{'scheme':<8}{'parameters':<52}{'ms/hash':>9}"
+        f"{'loaded ms':>11}{'hashes/s/core':>15}{'hashes/s':>10}"
+    )
+    measured = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for group in candidate_groups():
+            for candidate in group:
+                measure(candidate, pool, args.workers)
+                measured.append(candidate)
+                per_core = 1 / candidate.loaded_latency
+                print(
+                    f"{candidate.scheme:<8}{candidate.label:<52}"
+                    f"{candidate.latency * 1000:>9.1f}"
+                    f"{candidate.loaded_latency * 1000:>11.1f}"
+                    f"{per_core:>15.1f}{per_core * args.workers:>10.1f}"
+                )
+                if candidate.loaded_latency > target:
+                    break
+
+    for scheme in HANDLERS:
+        choice = pick(measured, scheme, target)
+        if choice is None:
+            print(f"\n# {scheme}: no configuration within {args.target_ms} ms")
+            continue
+        print(f"\n# {scheme}, {choice.loaded_latency * 1000:.0f} ms/hash")
+        # bcrypt stays listed so existing hashes still verify and get
+        # upgraded on login.
+        schemes = "bcrypt" if scheme == "bcrypt" else "argon2,bcrypt"
+        print(f"PASSWORD_SCHEMES={schemes}")
+        for key, value in choice.settings().items():
+            print(f"{key}={value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+"""Load test for the auth and user endpoints.
+
+Runs against a live server, e.g. the one started by `docker-compose up`:
+
+    python -m benchmarks.load --base-url http://localhost:9001 \
+        --concurrency 32 --requests 2000 --output results.json
+
+Pass --baseline baseline.json to compare against a stored run. The script
+exits with status 1 when any endpoint loses more than --tolerance of its
+baseline throughput or its p99 latency grows by more than --tolerance.
+--save-baseline writes the current results as the new baseline.
+
+Start the server with RATE_LIMIT_ENABLED=false: seeding and the login and
+register scenarios come from a single IP and would otherwise get 429s.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List
+
+import httpx
+
+API = "/api/v1"
+PASSWORD = "benchmark-password"
+
+
+class Scenario:
+    def __init__(self, name: str, requests: int):
+        self.name = name
+        self.requests = requests
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def report(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(value: float) -> float:
+            if not latencies:
+                return 0.0
+            index = min(len(latencies) - 1, int(len(latencies) * value))
+            return latencies[index] * 1000
+
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "rps": len(latencies) / self.elapsed if self.elapsed else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+        }
+
+
+async def run(
+    scenario: Scenario,
+    concurrency: int,
+    call: Callable[[int], Awaitable[httpx.Response]],
+    expected_status: int = 200,
+):
+    counter = itertools.count()
+
+    async def worker():
+        while True:
+            number = next(counter)
+            if number >= scenario.requests:
+                return
+            started = time.perf_counter()
+            try:
+                response = await call(number)
+                ok = response.status_code == expected_status
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                scenario.latencies.append(time.perf_counter() - started)
+            else:
+                scenario.errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    scenario.elapsed = time.perf_counter() - started
+
+
+def phone(run_id: str, number: int) -> str:
+    return f"+7{run_id}{number:07d}"
+
+
+async def seed(
+    client: httpx.AsyncClient, run_id: str, count: int, concurrency: int
+) -> List[int]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def register(number: int) -> int:
+        async with semaphore:
+            response = await client.post(
+                f"{API}/auth/register",
+                json={
+                    "name": f"Benchmark {number}",
+                    "phone": phone(run_id, number),
+                    "password": PASSWORD,
+                },
+            )
+        response.raise_for_status()
+        return response.json()["id"]
+
+    return await asyncio.gather(*(register(n) for n in range(count)))
+
+
+async def login_sessions(
+    client: httpx.AsyncClient, login: str, count: int
+) -> asyncio.Queue:
+    # Refresh tokens are single use, so every worker keeps rotating the
+    # token of its own session.
+    tokens: asyncio.Queue = asyncio.Queue()
+    for _ in range(count):
+        response = await client.post(
+            f"{API}/auth/login", json={"login": login, "password": PASSWORD}
+        )
+        response.raise_for_status()
+        tokens.put_nowait(response.json()["refresh_token"])
+    return tokens
+
+
+async def rotate(
+    client: httpx.AsyncClient, tokens: asyncio.Queue
+) -> httpx.Response:
+    token = await tokens.get()
+    try:
+        response = await client.post(
+            f"{API}/auth/refresh",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        if response.status_code == 200:
+            token = response.json()["refresh_token"]
+        return response
+    finally:
+        tokens.put_nowait(token)
+
+
+async def benchmark(args) -> Dict[str, dict]:
+    run_id = str(uuid.uuid4().int)[:4]
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=args.base_url, limits=limits, timeout=args.timeout
+    ) as client:
+        user_ids = await seed(client, run_id, args.users, args.concurrency)
+        refresh_tokens = await login_sessions(
+            client, phone(run_id, 0), args.concurrency
+        )
+
+        scenarios = [
+            (
+                Scenario("register", args.requests),
+                lambda n: client.post(
+                    f"{API}/auth/register",
+                    json={
+                        "name": "Benchmark",
+                        "phone": phone(run_id, args.users + n),
+                        "password": PASSWORD,
+                    },
+                ),
+            ),
+            (
+                Scenario("login", args.requests),
+                lambda n: client.post(
+                    f"{API}/auth/login",
+                    json={
+                        "login": phone(run_id, n % args.users),
+                        "password": PASSWORD,
+                    },
+                ),
+            ),
+            (
+                Scenario("refresh", args.requests),
+                lambda n: rotate(client, refresh_tokens),
+            ),
+            # Every seeded user is read once, so each request misses the
+            # cache; the number of requests is bounded by --users.
+            (
+                Scenario("users_by_id_miss", len(user_ids)),
+                lambda n: client.get(f"{API}/users/{user_ids[n]}"),
+            ),
+            (
+                Scenario("users_by_id_hit", args.requests),
+                lambda n: client.get(f"{API}/users/{user_ids[0]}"),
+            ),
+            (
+                Scenario("users_list", args.requests),
+                lambda n: client.get(f"{API}/users", params={"limit": 10}),
+            ),
+        ]
+        results = {}
+        for scenario, call in scenarios:
+            if args.only and scenario.name not in args.only:
+                continue
+            await run(scenario, args.concurrency, call)
+            results[scenario.name] = scenario.report()
+            print_row(scenario.name, results[scenario.name])
+        return results
+
+
+def print_row(name: str, result: dict):
+    print(
+        f"{name:<18}{result['requests']:>9}{result['errors']:>8}"
+        f"{result['rps']:>10.1f}{result['p50_ms']:>9.1f}"
+        f"{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+    )
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result["rps"] < reference["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['rps']:.1f} rps, "
+                f"baseline {reference['rps']:.1f}"
+            )
+        if result["p99_ms"] > reference["p99_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p99 {result['p99_ms']:.1f} ms, "
+                f"baseline {reference['p99_ms']:.1f}"
+            )
+        if result["errors"] > reference["errors"]:
+            regressions.append(
+                f"{name}: {result['errors']} errors, "
+                f"baseline {reference['errors']}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--base-url", default="http://localhost:9001")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--only", nargs="*", help="Scenarios to run")
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Compare with a stored run")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    print(
+        f"{'endpoint':<18}{'requests':>9}{'errors':>8}{'rps':>10}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    )
+    results = asyncio.run(benchmark(args))
+    document = {
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(document, output, indent=2)
+
+    if args.baseline:
+        if args.save_baseline:
+            with open(args.baseline, "w") as output:
+                json.dump(document, output, indent=2)
+            return
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print("\nRegressions against", args.baseline)
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print("\nNo regressions against", args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Latency the rate limiter adds to /auth/login and /auth/register.
+
+Usage: python -m benchmarks.ratelimit [--number 10000] [--phones 1000]
+Requires REDIS_URL from .env in the environment.
+
+Each check runs the sliding window script for the phone and IP windows
+in one round trip; PING is shown as the network floor. Limits are raised
+so that no check is rejected and every call takes the full path.
+"""
+
+import argparse
+import asyncio
+import time
+
+from app.internal import deps as internal_deps
+from app.internal.ratelimit import RateLimiter
+
+
+async def measure(number: int, call) -> float:
+    started = time.perf_counter()
+    for i in range(number):
+        await call(i)
+    return (time.perf_counter() - started) / number
+
+
+async def benchmark(args):
+    limiter = RateLimiter(
+        "benchmark:ratelimit",
+        {"login": {"phone": f"{args.number}/60", "ip": f"{args.number}/60"}},
+    )
+    redis = await internal_deps.get_async_redis()
+
+    async def ping(i: int):
+        await redis.ping()
+
+    async def check(i: int):
+        await limiter.check(
+            "login", phone=f"+7{i % args.phones:010d}", ip="127.0.0.1"
+        )
+
+    await measure(100, ping)
+    ping_time = await measure(args.number, ping)
+    check_time = await measure(args.number, check)
+    await internal_deps.close_redis_pools()
+
+    print(f"{'call':<10}{'us/request':>12}")
+    print(f"{'ping':<10}{ping_time * 1e6:>12.1f}")
+    print(f"{'check':<10}{check_time * 1e6:>12.1f}")
+    print(
+        f"allowed: {limiter.stats.allowed}, "
+        f"rejected: {limiter.stats.rejected}, errors: {limiter.stats.errors}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=10000)
+    parser.add_argument("--phones", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
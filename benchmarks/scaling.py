@@ -0,0 +1,118 @@
+"""Throughput of the API server from 1 to N worker processes.
+
+Usage: python -m benchmarks.scaling [--workers 1 2 4 8] [--port 9100]
+    [--server gunicorn|uvicorn] [--only login users_by_id_hit ...]
+
+Needs the Postgres and Redis from .env in the environment. For every
+worker count the script starts `python -m app.server` on --port with rate
+limiting off, waits until it answers, runs the benchmarks.load scenarios
+against it and stops it again. The summary shows requests per second per
+scenario and the speedup over the smallest worker count. By default the
+worker counts double up to the number of available CPUs.
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import httpx
+
+from app.settings import available_cpus
+from benchmarks import load
+
+
+def worker_counts() -> list:
+    counts, workers = [], 1
+    while workers < available_cpus():
+        counts.append(workers)
+        workers *= 2
+    return counts + [available_cpus()]
+
+
+def start_server(args, workers: int) -> subprocess.Popen:
+    command = [sys.executable, "-m", "app.server"]
+    command += ["--port", str(args.port), "--workers", str(workers)]
+    if args.server:
+        command += ["--server", args.server]
+    environment = dict(os.environ, RATE_LIMIT_ENABLED="false")
+    return subprocess.Popen(command, env=environment)
+
+
+def wait_ready(base_url: str, server: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("server exited during start-up")
+        try:
+            if httpx.get(f"{base_url}/metrics").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server not ready after {timeout} s")
+
+
+def stop_server(server: subprocess.Popen):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--workers", type=int, nargs="*")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--server", choices=("gunicorn", "uvicorn"))
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--only", nargs="*", help="Scenarios to run")
+    args = parser.parse_args()
+    args.base_url = f"http://127.0.0.1:{args.port}"
+
+    results = {}
+    for workers in args.workers or worker_counts():
+        print(f"\n{workers} workers")
+        print(
+            f"{'endpoint':<18}{'requests':>9}{'errors':>8}{'rps':>10}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        )
+        server = start_server(args, workers)
+        try:
+            wait_ready(args.base_url, server, args.startup_timeout)
+            results[workers] = asyncio.run(load.benchmark(args))
+        finally:
+            stop_server(server)
+
+    counts = list(results)
+    first = results[counts[0]]
+    print(f"\n{'rps':<18}" + "".join(f"{n:>10}" for n in counts))
+    for name in first:
+        print(
+            f"{name:<18}"
+            + "".join(f"{results[n][name]['rps']:>10.1f}" for n in counts)
+        )
+    print(f"\n{'speedup':<18}" + "".join(f"{n:>10}" for n in counts))
+    for name in first:
+        baseline = first[name]["rps"] or 1
+        print(
+            f"{name:<18}"
+            + "".join(
+                f"{results[n][name]['rps'] / baseline:>10.2f}" for n in counts
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Latency of the user search on a large table.
+
+Usage: python -m benchmarks.search [--rows 3000000] [--number 200]
+    [--explain]
+
+Runs the search function directly against the database from .env, so the
+numbers exclude HTTP overhead. Missing benchmark rows (phones starting
+with +1) get random-looking names and phones and are inserted with a
+single INSERT ... SELECT over generate_series, followed by ANALYZE. Each
+query is run --number times with one page of default size; --explain
+prints the plan of each query once, to check the trigram indexes are used.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from app.database.deps import async_read_session, dispose_engine, get_engine
+from app.internal import user as user_internal
+
+SEED_QUERY = text("""
+    INSERT INTO users (name, phone, password)
+    SELECT initcap(substr(md5(i::text), 1, 6)) || ' '
+        || initcap(substr(md5((i * 7)::text), 1, 8)),
+        '+1' || lpad(i::text, 10, '0'), '\\x00'::bytea
+    FROM generate_series(:start, :stop) AS i
+    """)
+COUNT_QUERY = text("SELECT count(*) FROM users WHERE phone LIKE '+1%'")
+# (mode, query) pairs: a selective and a broad name prefix, a phone
+# fragment from the middle of the number and a misspelt name (row 1 is
+# "C4ca42 8f14e45f").
+QUERIES = (
+    ("prefix", "C4ca42"),
+    ("prefix", "Ab"),
+    ("prefix", "0012345"),
+    ("fuzzy", "C4ca24 8f14e4"),
+)
+
+
+async def seed(rows: int):
+    async with get_engine().begin() as connection:
+        existing = (await connection.execute(COUNT_QUERY)).scalar()
+        if existing < rows:
+            started = time.perf_counter()
+            await connection.execute(
+                SEED_QUERY, {"start": existing + 1, "stop": rows}
+            )
+            await connection.execute(text("ANALYZE users"))
+            print(
+                f"seeded {rows - existing} rows in "
+                f"{time.perf_counter() - started:.1f} s"
+            )
+
+
+async def explain(mode: str, query: str):
+    statement = user_internal.search_query(query, mode).limit(
+        user_internal.PAGINATION_SIZE + 1
+    )
+    # Named paramstyle keeps "%" single; text() escapes it for the driver.
+    compiled = statement.compile(
+        dialect=postgresql.dialect(paramstyle="named"),
+        compile_kwargs={"literal_binds": True},
+    )
+    async with async_read_session() as session:
+        plan = await session.execute(text("EXPLAIN ANALYZE " + str(compiled)))
+    print(f"\n{mode} {query!r}")
+    for (line,) in plan:
+        print("  " + line)
+
+
+async def measure(mode: str, query: str, number: int) -> Tuple[list, int]:
+    latencies = []
+    async with async_read_session() as session:
+        for _ in range(number):
+            started = time.perf_counter()
+            page = await user_internal.search(session, query, mode)
+            latencies.append(time.perf_counter() - started)
+    return latencies, len(page.items)
+
+
+async def benchmark(args):
+    await seed(args.rows)
+    print(
+        f"{'mode':<8}{'query':<18}{'found':>6}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"
+    )
+    for mode, query in QUERIES:
+        latencies, found = await measure(mode, query, args.number)
+        latencies = sorted(latency * 1000 for latency in latencies)
+        print(
+            f"{mode:<8}{query:<18}{found:>6}"
+            f"{statistics.median(latencies):>9.2f}"
+            f"{latencies[int(len(latencies) * 0.95)]:>9.2f}"
+            f"{latencies[-1]:>9.2f}"
+        )
+    if args.explain:
+        for mode, query in QUERIES:
+            await explain(mode, query)
+    await dispose_engine()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=3000000)
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument("--explain", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Response serialization: FastAPI's response_model path vs. the fast path.
+
+Usage: python -m benchmarks.serialization [--number 20000] [--items 100]
+
+"before" is what FastAPI does with a returned model: validate it against
+response_model, run jsonable_encoder and render a JSONResponse. "after"
+is what the user routes do now:
+- user: the cached JSON document goes out as is;
+- batch: cached documents are spliced into the batch document;
+- page: the already validated page is dumped with the configured
+  RESPONSE_CLASS serializer.
+No database or Redis is involved; --items is the size of the batch and
+the page.
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.internal import responses
+from app.internal import user as user_internal
+from app.internal.codecs import get_codec
+from app.schemas.user import (
+    BatchUserScheme,
+    GetUserScheme,
+    UsersBatchScheme,
+    UsersPageScheme,
+)
+
+
+async def measure(number: int, call) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        await call()
+    return (time.perf_counter() - started) / number
+
+
+def before(model_class, model):
+    field = create_response_field("response", model_class)
+
+    async def call():
+        content = await serialize_response(field=field, response_content=model)
+        return JSONResponse(content).body
+
+    return call
+
+
+async def benchmark(args):
+    users = [
+        GetUserScheme(id=i, name=f"Alice Liddell {i}", phone=f"+7{i:010d}")
+        for i in range(1, args.items + 1)
+    ]
+    codec = get_codec("json", GetUserScheme, 1)
+    bodies = {user.id: codec.body(codec.encode(user)) for user in users}
+    ids = list(bodies)
+    batch = UsersBatchScheme(
+        items=[BatchUserScheme(id=u.id, found=True, user=u) for u in users]
+    )
+    page = UsersPageScheme(items=users, next_cursor="MTAw")
+
+    async def user_after():
+        return responses.RawJSONResponse(bodies[1]).body
+
+    async def batch_after():
+        return responses.RawJSONResponse(
+            user_internal.encode_batch(ids, bodies)
+        ).body
+
+    async def page_after():
+        return responses.model_response(page).body
+
+    cases = [
+        ("user", before(GetUserScheme, users[0]), user_after),
+        ("batch", before(UsersBatchScheme, batch), batch_after),
+        ("page", before(UsersPageScheme, page), page_after),
+    ]
+    print(f"serializer: {responses.response_class.__name__}")
+    print(f"{'response':<10}{'before us':>12}{'after us':>12}{'speedup':>10}")
+    for name, before_call, after_call in cases:
+        number = args.number if name == "user" else args.number // 10
+        await measure(100, before_call)
+        await measure(100, after_call)
+        before_time = await measure(number, before_call)
+        after_time = await measure(number, after_call)
+        print(
+            f"{name:<10}{before_time * 1e6:>12.1f}{after_time * 1e6:>12.1f}"
+            f"{before_time / after_time:>10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
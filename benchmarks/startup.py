@@ -0,0 +1,77 @@
+"""Worker cold-start time.
+
+Usage: python -m benchmarks.startup [--runs 10] [--lifespan]
+
+Every run starts a fresh interpreter that imports app.main and calls
+create_app(), the work a server does for each worker it boots. With
+--lifespan it also runs the start-up half of the lifespan (database pool
+warm-up, Redis, hashing executor), which needs the services from .env.
+Reported numbers are medians; "process" is the wall time of the whole
+interpreter run as seen from outside, shutdown included.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+WORKER = """
+import asyncio, json, sys, time
+
+started = time.perf_counter()
+import app.main
+
+imported = time.perf_counter()
+application = app.main.create_app()
+result = {
+    "import": imported - started,
+    "create_app": time.perf_counter() - imported,
+}
+if sys.argv[1] == "lifespan":
+    async def start():
+        async with app.main.lifespan(application):
+            pass
+
+    asyncio.run(start())
+    for phase in ("database", "redis", "hashing"):
+        result[phase] = app.main.startup_timings[phase]
+print(json.dumps(result))
+"""
+
+
+def run_worker(lifespan: bool) -> Dict[str, float]:
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER, "lifespan" if lifespan else "-"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process"] = time.perf_counter() - started
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--lifespan", action="store_true")
+    args = parser.parse_args()
+
+    runs: List[Dict[str, float]] = [
+        run_worker(args.lifespan) for _ in range(args.runs)
+    ]
+    print(f"{'phase':<12}{'median ms':>10}{'max ms':>10}")
+    for phase in runs[0]:
+        values = [run[phase] * 1000 for run in runs]
+        print(
+            f"{phase:<12}{statistics.median(values):>10.1f}"
+            f"{max(values):>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""users trigram search indexes
+
+Revision ID: 3b7ab1725175
+Revises: 992159c802d2
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3b7ab1725175"
+down_revision = "992159c802d2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # GIN trigram indexes serve LIKE/ILIKE with any anchoring as well as
+    # the similarity operator (%) used by fuzzy search.
+    op.create_index(
+        "ix_users_name_trgm",
+        "users",
+        ["name"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_users_phone_trgm",
+        "users",
+        ["phone"],
+        unique=False,
+        postgresql_using="gin",
+        postgresql_ops={"phone": "gin_trgm_ops"},
+    )
+
+
+def downgrade():
+    # pg_trgm stays installed; other objects may depend on it.
+    op.drop_index("ix_users_phone_trgm", table_name="users")
+    op.drop_index("ix_users_name_trgm", table_name="users")
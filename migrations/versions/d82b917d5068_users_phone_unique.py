@@ -0,0 +1,27 @@
+"""users phone unique index
+
+Revision ID: d82b917d5068
+Revises: 3b7ab1725175
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d82b917d5068"
+down_revision = "3b7ab1725175"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Matches the model's unique=True, which ON CONFLICT in the bulk import
+    # relies on. Fails if the table already holds duplicate phones; those
+    # have to be resolved by hand first.
+    op.drop_index("ix_users_phone", table_name="users")
+    op.create_index("ix_users_phone", "users", ["phone"], unique=True)
+
+
+def downgrade():
+    op.drop_index("ix_users_phone", table_name="users")
+    op.create_index("ix_users_phone", "users", ["phone"], unique=False)